@@ -1,6 +1,8 @@
 import pygame
 import numpy as np
+from numba import jit, prange
 from scipy import signal
+import math
 import os
 from datetime import datetime
 
@@ -9,6 +11,11 @@ WIDTH, HEIGHT = 1900, 1000
 
 CELL_SZ = 10
 
+LIGHT_GRAY = (200, 200, 200)
+
+# Key j jumps 2^JUMP generations with HashLife
+JUMP = 10
+
 grid_w = WIDTH // CELL_SZ
 grid_h = HEIGHT // CELL_SZ
 
@@ -30,11 +37,710 @@ def update(grid):
     new_grid[np.logical_and(grid == 0, neighbors == 3)] = 1
     return new_grid
 
-def draw_grid(screen, grid):
-    for y in range(grid_h):
-        for x in range(grid_w):
-            color = (0, 0, 0) if grid[y, x] else (255, 255, 255)
-            pygame.draw.rect(screen, color, (x * CELL_SZ + 1, y * CELL_SZ + 1, CELL_SZ - 2, CELL_SZ - 2))
+# Bit-packed grid: 64 cells to a uint64 word, bit i of word j of a row being
+# cell 64 * j + i of that row. Bits past the grid width are kept clear.
+ONE = np.uint64(1)
+TOP = np.uint64(63)
+FULL = np.uint64(0xFFFFFFFFFFFFFFFF)
+
+def pack(grid):
+    bits = np.packbits(grid.astype(bool), axis=1, bitorder='little')
+    words = -(-grid.shape[1] // 64)
+    padded = np.zeros((grid.shape[0], words * 8), dtype=np.uint8)
+    padded[:, :bits.shape[1]] = bits
+    return padded.view('<u8').astype(np.uint64, copy=False)
+
+def unpack(cells, width):
+    return np.unpackbits(cells.view(np.uint8), axis=1, count=width, bitorder='little')
+
+# Neighbours to the west and east of the cells in word j: the row shifted one
+# cell, with the bit carried in from the next word. The grid wraps like
+# boundary='wrap', so word 0 takes cell width - 1 and the last word cell 0,
+# which lands on bit tail, the last cell's bit in its word.
+@jit(nopython=True, nogil=True, cache=True)
+def west(row, j, tail):
+    if j == 0:
+        carry = (row[len(row) - 1] >> tail) & ONE
+    else:
+        carry = row[j - 1] >> TOP
+    return (row[j] << ONE) | carry
+
+@jit(nopython=True, nogil=True, cache=True)
+def east(row, j, tail):
+    if j == len(row) - 1:
+        carry = (row[0] & ONE) << tail
+    else:
+        carry = (row[j + 1] & ONE) << TOP
+    return (row[j] >> ONE) | carry
+
+# The next generation of 64 cells with bit-sliced adders, given the words
+# above, level with and below them, each with its west and east neighbours.
+# Each of the three rows sums its neighbours to a 2-bit count per cell (the
+# middle row leaves out the cell itself). Adding those, the count is
+# low + 2 * high, where high is the number of set bits among the three high
+# bits and the carry out of the low bits. A cell lives if that number is
+# exactly one: three neighbours if the low bit is set, two otherwise, which
+# only keeps a live cell alive.
+@jit(nopython=True, nogil=True, cache=True)
+def next_cells(up_west, up, up_east, row_west, row, row_east, down_west, down, down_east):
+    low_up = up_west ^ up ^ up_east
+    high_up = (up_west & up) | (up_east & (up_west ^ up))
+    low_down = down_west ^ down ^ down_east
+    high_down = (down_west & down) | (down_east & (down_west ^ down))
+    low_row = row_west ^ row_east
+    high_row = row_west & row_east
+
+    low = low_up ^ low_down ^ low_row
+    carry = (low_up & low_down) | (low_row & (low_up ^ low_down))
+    pairs = (high_up & high_down) | (high_row & carry)
+    one = high_up ^ high_down ^ high_row ^ carry
+    return one & ~pairs & (low | row)
+
+# Word j of the next generation of row. Bits past the width still need masking.
+@jit(nopython=True, nogil=True, cache=True)
+def next_word(up, row, down, j, tail):
+    return next_cells(west(up, j, tail), up[j], east(up, j, tail),
+                      west(row, j, tail), row[j], east(row, j, tail),
+                      west(down, j, tail), down[j], east(down, j, tail))
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def step_packed(cells, width, out):
+    height, words = cells.shape
+    tail = np.uint64((width - 1) % 64)
+    mask = FULL >> (TOP - tail)
+    for y in prange(height):
+        up = cells[(y + height - 1) % height]
+        row = cells[y]
+        down = cells[(y + 1) % height]
+        for j in range(words):
+            cell = next_word(up, row, down, j, tail)
+            if j == words - 1:
+                cell &= mask
+            out[y, j] = cell
+    return out
+
+# The packed engine's update(): writes the next generation into out and
+# returns it, so two buffers can take turns
+def update_packed(cells, width, out=None):
+    if out is None:
+        out = np.empty_like(cells)
+    return step_packed(cells, width, out)
+
+# Tiles are one word wide and TILE_ROWS rows high. A tile is active if it or
+# one of its eight neighbours, wrapping round the grid, changed over the last
+# two generations. Every other tile is a still life or a period-2 oscillator
+# for now, blinkers being everywhere in a settled soup.
+TILE_ROWS = 16
+
+@jit(nopython=True, nogil=True, cache=True)
+def active_tiles(changed):
+    rows, words = changed.shape
+    active = np.zeros_like(changed)
+    for ty in range(rows):
+        for tx in range(words):
+            if changed[ty, tx]:
+                for dy in range(-1, 2):
+                    for dx in range(-1, 2):
+                        active[(ty + dy + rows) % rows, (tx + dx + words) % words] = True
+    return active
+
+# step_packed() for the active tiles only, a row of tiles at a time. out
+# holds the generation before cells, and an inactive tile's next generation
+# is that same one, so other tiles of out are left alone. changed records
+# which tiles differ from out's old contents, moving which differ from cells;
+# moving is kept for inactive tiles, whose oscillation carries on as it was.
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def step_tiles(cells, width, out, active, changed, moving):
+    height, words = cells.shape
+    tail = np.uint64((width - 1) % 64)
+    mask = FULL >> (TOP - tail)
+    for ty in prange(active.shape[0]):
+        changed[ty] = False
+        if not active[ty].any():
+            continue
+        diff = np.zeros(words, dtype=np.uint64)
+        moved = np.zeros(words, dtype=np.uint64)
+        for y in range(ty * TILE_ROWS, min(ty * TILE_ROWS + TILE_ROWS, height)):
+            up = cells[(y + height - 1) % height]
+            row = cells[y]
+            down = cells[(y + 1) % height]
+            for j in range(words):
+                if active[ty, j]:
+                    cell = next_word(up, row, down, j, tail)
+                    if j == words - 1:
+                        cell &= mask
+                    diff[j] |= cell ^ out[y, j]
+                    moved[j] |= cell ^ row[j]
+                    out[y, j] = cell
+        for j in range(words):
+            if active[ty, j]:
+                changed[ty, j] = diff[j] != 0
+                moving[ty, j] = moved[j] != 0
+    return out
+
+# The packed engine with active tiles, so a settled board costs little more
+# than its moving parts. dirty collects the tiles that moved since the last
+# draw(), which repaints only those.
+class PackedLife:
+    def __init__(self, grid):
+        self.set_grid(grid)
+
+    def set_grid(self, grid):
+        self.width = grid.shape[1]
+        self.cells = pack(grid)
+        self.spare = np.empty_like(self.cells)
+        self.changed = np.ones((-(-grid.shape[0] // TILE_ROWS), self.cells.shape[1]), dtype=np.bool_)
+        self.next_changed = np.empty_like(self.changed)
+        self.moving = np.ones_like(self.changed)
+        # An edited tile is no longer the generation after the one in spare,
+        # so it stays active for the step after next too. A new grid counts as
+        # edited everywhere.
+        self.edited = np.ones_like(self.changed)
+        self.dirty = None
+
+    def grid(self):
+        return unpack(self.cells, self.width)
+
+    def step(self):
+        step_tiles(self.cells, self.width, self.spare, active_tiles(self.changed), self.next_changed, self.moving)
+        self.cells, self.spare = self.spare, self.cells
+        self.changed, self.next_changed = self.next_changed, self.changed
+        if self.edited.any():
+            self.changed |= self.edited
+            self.edited[:] = False
+        if self.dirty is not None:
+            self.dirty |= self.moving
+
+    def toggle(self, x, y):
+        self.cells[y, x // 64] ^= ONE << np.uint64(x % 64)
+        self.changed[y // TILE_ROWS, x // 64] = True
+        self.edited[y // TILE_ROWS, x // 64] = True
+        if self.dirty is not None:
+            self.dirty[y // TILE_ROWS, x // 64] = True
+
+    def clear(self):
+        self.set_grid(np.zeros((self.cells.shape[0], self.width), dtype=int))
+
+    def draw(self, screen, cell=CELL_SZ):
+        height = self.cells.shape[0]
+        if self.dirty is None or not board_fits(self.width, height, cell):
+            draw_grid(screen, self.grid(), cell)
+            self.dirty = np.zeros_like(self.changed)
+            return
+        for ty, tx in zip(*np.nonzero(self.dirty)):
+            y0 = ty * TILE_ROWS
+            y1 = min(y0 + TILE_ROWS, height)
+            tile = np.unpackbits(self.cells[y0:y1, tx:tx + 1].view(np.uint8), axis=1,
+                                 count=min(64, self.width - tx * 64), bitorder='little')
+            paint_cells(tile, tx * 64, y0, cell)
+        self.dirty[:] = False
+        blit_board(screen)
+
+# The unbounded plane, stored sparsely. Only the 64x64 chunks holding live
+# cells exist, chunk (cx, cy) covering columns 64 * cx to 64 * cx + 63 of
+# rows 64 * cy to 64 * cy + 63 as one word a row, in pack()'s bit order.
+# Chunks are kept sorted by key, so a step finds the neighbours of all of
+# them with one searchsorted, and both memory and step cost follow the live
+# population rather than its bounding box.
+CHUNK = 64
+
+# Keys order chunks by cx, then cy, and stay unique for coordinates within
+# 2^31 chunks of the origin
+def chunk_key(cx, cy):
+    return cx * (1 << 32) + cy
+
+# The nine chunks around a chunk, itself in the middle, as key offsets
+AROUND = chunk_key(np.tile(np.arange(-1, 2), 3), np.repeat(np.arange(-1, 2), 3))
+
+# Which of the nine chunks around each chunk can hold live cells next
+# generation: itself, and those its border cells touch
+@jit(nopython=True, nogil=True, cache=True)
+def reach(chunks):
+    near = np.zeros((len(chunks), 9), dtype=np.bool_)
+    for i in range(len(chunks)):
+        # Every row ORed together, bit 0 being the west edge and bit 63 the east
+        columns = np.uint64(0)
+        for y in range(CHUNK):
+            columns |= chunks[i, y]
+        top = chunks[i, 0]
+        bottom = chunks[i, CHUNK - 1]
+        near[i, 0] = (top & ONE) != 0
+        near[i, 1] = top != 0
+        near[i, 2] = (top >> TOP) != 0
+        near[i, 3] = (columns & ONE) != 0
+        near[i, 4] = True
+        near[i, 5] = (columns >> TOP) != 0
+        near[i, 6] = (bottom & ONE) != 0
+        near[i, 7] = bottom != 0
+        near[i, 8] = (bottom >> TOP) != 0
+    return near
+
+# Column dx of the chunks around chunk i, the middle one's rows with the
+# row above and the row below, as CHUNK + 2 words. Chunks that do not exist
+# are empty.
+@jit(nopython=True, nogil=True, cache=True)
+def chunk_column(chunks, around, i, dx):
+    words = np.zeros(CHUNK + 2, dtype=np.uint64)
+    k = around[i, dx]
+    if k >= 0:
+        words[0] = chunks[k, CHUNK - 1]
+    k = around[i, 3 + dx]
+    if k >= 0:
+        words[1:CHUNK + 1] = chunks[k]
+    k = around[i, 6 + dx]
+    if k >= 0:
+        words[CHUNK + 1] = chunks[k, 0]
+    return words
+
+# The next generation of every chunk in around, whose rows give the indices
+# of its nine chunks in chunks, -1 where there is none. Neighbours to the
+# west and east are shifted in from the chunks either side, as west() and
+# east() do from the words either side.
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def step_chunks(chunks, around, out):
+    for i in prange(len(around)):
+        left = chunk_column(chunks, around, i, 0)
+        rows = chunk_column(chunks, around, i, 1)
+        right = chunk_column(chunks, around, i, 2)
+        west_cells = (rows << ONE) | (left >> TOP)
+        east_cells = (rows >> ONE) | ((right & ONE) << TOP)
+        for y in range(CHUNK):
+            out[i, y] = next_cells(west_cells[y], rows[y], east_cells[y],
+                                   west_cells[y + 1], rows[y + 1], east_cells[y + 1],
+                                   west_cells[y + 2], rows[y + 2], east_cells[y + 2])
+    return out
+
+class SparseLife:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.chunks = np.zeros((0, CHUNK), dtype=np.uint64)
+
+    # Loads a grid of 0/1 cells with its top-left cell at (x, y), replacing
+    # whatever was there
+    def set_grid(self, grid, x=0, y=0):
+        height, width = grid.shape
+        cx, left = divmod(x, CHUNK)
+        cy, top = divmod(y, CHUNK)
+        rows = -(-(top + height) // CHUNK)
+        words = -(-(left + width) // CHUNK)
+        padded = np.zeros((rows * CHUNK, words * CHUNK), dtype=np.uint8)
+        padded[top:top + height, left:left + width] = grid != 0
+        chunks = pack(padded).reshape(rows, CHUNK, words).transpose(0, 2, 1).reshape(-1, CHUNK)
+        keys = chunk_key(cx + np.arange(words)[None, :], cy + np.arange(rows)[:, None]).ravel()
+        live = chunks.any(axis=1)
+        order = np.argsort(keys[live])
+        self.keys = keys[live][order]
+        self.chunks = np.ascontiguousarray(chunks[live][order])
+
+    # The width x height window of the plane with its top-left cell at (x, y)
+    def get_grid(self, x, y, width, height):
+        grid = np.zeros((height, width), dtype=int)
+        cx = (self.keys + (1 << 31)) >> 32
+        cy = self.keys - chunk_key(cx, 0)
+        left = cx * CHUNK - x
+        top = cy * CHUNK - y
+        seen = (left < width) & (left + CHUNK > 0) & (top < height) & (top + CHUNK > 0)
+        for chunk, left, top in zip(self.chunks[seen], left[seen], top[seen]):
+            cells = unpack(chunk.reshape(CHUNK, 1), CHUNK)
+            x0, y0 = max(left, 0), max(top, 0)
+            x1, y1 = min(left + CHUNK, width), min(top + CHUNK, height)
+            grid[y0:y1, x0:x1] = cells[y0 - top:y1 - top, x0 - left:x1 - left]
+        return grid
+
+    # Index of each key's chunk, -1 for keys without one
+    def find(self, keys):
+        if len(self.keys) == 0:
+            return np.full(keys.shape, -1)
+        index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[index] == keys, index, -1)
+
+    # Chunks that end up empty are dropped, so the plane never holds more
+    # than the live chunks and the ones they were born into
+    def step(self):
+        keys = np.unique((self.keys[:, None] + AROUND)[reach(self.chunks)])
+        around = self.find(keys[:, None] + AROUND)
+        out = step_chunks(self.chunks, around, np.empty((len(keys), CHUNK), dtype=np.uint64))
+        live = out.any(axis=1)
+        self.keys = keys[live]
+        self.chunks = out[live]
+
+    def toggle(self, x, y):
+        key = chunk_key(x // CHUNK, y // CHUNK)
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            self.keys = np.insert(self.keys, i, key)
+            self.chunks = np.insert(self.chunks, i, 0, axis=0)
+        self.chunks[i, y % CHUNK] ^= ONE << np.uint64(x % CHUNK)
+
+    def population(self):
+        return int(np.unpackbits(self.chunks.view(np.uint8)).sum())
+
+# HashLife: the universe is a quadtree whose identical squares are one shared
+# node, found through a table keyed by the four children. A node of level k
+# is a 2^k square; its RESULT is its centre half 2^(k-2) generations on,
+# computed once from nine overlapping sub-squares and kept on the node, so
+# repeated structure in space and time is only ever evaluated once. Unlike
+# the array engines the plane does not wrap: it grows to hold the pattern.
+class Node:
+    __slots__ = ("level", "nw", "ne", "sw", "se", "population", "result")
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.population = population
+        self.result = None
+
+# Next generation of the centre 2x2 of every 4x4 square, both as bits in row
+# order (bit 4 * row + col)
+def life_4x4_table():
+    codes = np.arange(1 << 16)
+    cells = ((codes[:, None] >> np.arange(16)) & 1).reshape(-1, 4, 4)
+    table = np.zeros(1 << 16, dtype=np.int64)
+    for bit, (row, col) in enumerate(((1, 1), (1, 2), (2, 1), (2, 2))):
+        neighbors = cells[:, row - 1:row + 2, col - 1:col + 2].sum(axis=(1, 2)) - cells[:, row, col]
+        alive = (neighbors == 3) | ((cells[:, row, col] == 1) & (neighbors == 2))
+        table |= alive.astype(np.int64) << bit
+    return table
+
+class HashLife:
+    def __init__(self, max_nodes=1000000):
+        # Past max_nodes the table is rebuilt from the nodes still in use and
+        # every memoized result is dropped
+        self.max_nodes = max_nodes
+        self.table = {}
+        self.steps = {}
+        self.leaves = (Node(0, None, None, None, None, 0), Node(0, None, None, None, None, 1))
+        self.rule = life_4x4_table()
+        self.squares = [self.join(*(self.leaves[(code >> i) & 1] for i in range(4))) for code in range(16)]
+        self.zeros = [self.leaves[0]]
+        self.root = self.zero(3)
+        # set_grid() reads grids in blocks this many levels high. At 9 no level
+        # of a block has over 2^14 distinct squares, so block() can key four of
+        # them in an int64.
+        self.block_level = 9
+        # Cell coordinates of the root's top-left corner
+        self.x = 0
+        self.y = 0
+        self.generation = 0
+
+    def join(self, nw, ne, sw, se):
+        key = (id(nw), id(ne), id(sw), id(se))
+        node = self.table.get(key)
+        if node is None:
+            node = Node(nw.level + 1, nw, ne, sw, se,
+                        nw.population + ne.population + sw.population + se.population)
+            self.table[key] = node
+            if len(self.table) > self.max_nodes:
+                self.collect()
+        return node
+
+    def zero(self, level):
+        while len(self.zeros) <= level:
+            z = self.zeros[-1]
+            self.zeros.append(self.join(z, z, z, z))
+        return self.zeros[level]
+
+    # The same square in the middle of one twice its size
+    def centre(self, node):
+        z = self.zero(node.level - 1)
+        return self.join(self.join(z, z, z, node.nw), self.join(z, z, node.ne, z),
+                         self.join(z, node.sw, z, z), self.join(node.se, z, z, z))
+
+    def inner(self, node):
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def life_4x4(self, node):
+        code = 0
+        for i, quadrant in enumerate((node.nw, node.ne, node.sw, node.se)):
+            offset = (i >> 1) * 8 + (i & 1) * 2
+            code |= (quadrant.nw.population << offset) | (quadrant.ne.population << (offset + 1)) | \
+                    (quadrant.sw.population << (offset + 4)) | (quadrant.se.population << (offset + 5))
+        return self.squares[self.rule[code]]
+
+    # Centre half of node 2^j generations on, for j up to node.level - 2.
+    # The full step is the node's RESULT; shorter ones are kept in steps.
+    def successor(self, node, j):
+        full = j == node.level - 2
+        if full and node.result is not None:
+            return node.result
+        if not full:
+            result = self.steps.get((node, j))
+            if result is not None:
+                return result
+        if node.population == 0:
+            result = self.zero(node.level - 1)
+        elif node.level == 2:
+            result = self.life_4x4(node)
+        else:
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            inner = min(j, node.level - 3)
+            c1 = self.successor(nw, inner)
+            c2 = self.successor(self.join(nw.ne, ne.nw, nw.se, ne.sw), inner)
+            c3 = self.successor(ne, inner)
+            c4 = self.successor(self.join(nw.sw, nw.se, sw.nw, sw.ne), inner)
+            c5 = self.successor(self.inner(node), inner)
+            c6 = self.successor(self.join(ne.sw, ne.se, se.nw, se.ne), inner)
+            c7 = self.successor(sw, inner)
+            c8 = self.successor(self.join(sw.ne, se.nw, sw.se, se.sw), inner)
+            c9 = self.successor(se, inner)
+            if full:
+                # 2^(k-3) generations in the nine, 2^(k-3) more in the four
+                result = self.join(self.successor(self.join(c1, c2, c4, c5), inner),
+                                   self.successor(self.join(c2, c3, c5, c6), inner),
+                                   self.successor(self.join(c4, c5, c7, c8), inner),
+                                   self.successor(self.join(c5, c6, c8, c9), inner))
+            else:
+                result = self.join(self.join(c1.se, c2.sw, c4.ne, c5.nw), self.join(c2.se, c3.sw, c5.ne, c6.nw),
+                                   self.join(c4.se, c5.sw, c7.ne, c8.nw), self.join(c5.se, c6.sw, c8.ne, c9.nw))
+        if full:
+            node.result = result
+        else:
+            self.steps[(node, j)] = result
+        return result
+
+    # Advances 2^k generations at once. The root is padded until the pattern
+    # cannot reach the edge of the result, and trimmed back afterwards.
+    def step(self, k=0):
+        while self.root.level < k + 1:
+            self.expand()
+        self.expand()
+        self.expand()
+        self.root = self.successor(self.root, k)
+        self.x += 1 << (self.root.level - 1)
+        self.y += 1 << (self.root.level - 1)
+        self.generation += 1 << k
+        while self.root.level > 3 and self.inner(self.root).population == self.root.population:
+            self.x += 1 << (self.root.level - 2)
+            self.y += 1 << (self.root.level - 2)
+            self.root = self.inner(self.root)
+
+    def expand(self):
+        self.x -= 1 << (self.root.level - 1)
+        self.y -= 1 << (self.root.level - 1)
+        self.root = self.centre(self.root)
+
+    # Any number of generations, in power-of-two jumps
+    def advance(self, generations):
+        k = 0
+        while generations:
+            if generations & 1:
+                self.step(k)
+            generations >>= 1
+            k += 1
+
+    # Garbage collection: keeps the nodes reachable from the root, the empty
+    # squares and the 2x2 squares. Nodes still held by a step in progress
+    # stay valid but are no longer shared.
+    def collect(self):
+        live = {}
+        stack = [self.root] + self.zeros[1:] + self.squares
+        while stack:
+            node = stack.pop()
+            key = (id(node.nw), id(node.ne), id(node.sw), id(node.se))
+            if node.level == 0 or key in live:
+                continue
+            node.result = None
+            live[key] = node
+            stack.extend((node.nw, node.ne, node.sw, node.se))
+        self.table = live
+        self.steps = {}
+        if len(live) > self.max_nodes // 2:
+            raise MemoryError(f"pattern needs over half of the {self.max_nodes} node table")
+
+    # Loads a grid of 0/1 cells, such as create_grid() makes, with its top-left
+    # cell at (x, y). The grid is read in square blocks of 2^block_level cells,
+    # so nothing the size of the whole padded square is ever made, and the
+    # nodes of the blocks are then joined up to the root.
+    def set_grid(self, grid, x=0, y=0):
+        level = max(3, math.ceil(math.log2(max(grid.shape))))
+        block_level = min(level, self.block_level)
+        size = 1 << block_level
+        span = 1 << level
+        nodes = [[self.block(grid[top:top + size, left:left + size], block_level)
+                  for left in range(0, span, size)] for top in range(0, span, size)]
+        while len(nodes) > 1:
+            nodes = [[self.join(nodes[r][c], nodes[r][c + 1], nodes[r + 1][c], nodes[r + 1][c + 1])
+                      for c in range(0, len(nodes), 2)] for r in range(0, len(nodes), 2)]
+        self.root = nodes[0][0]
+        self.x = x
+        self.y = y
+        self.generation = 0
+
+    # The node for cells padded with dead ones to a 2^level square. The 2x2
+    # squares come straight from their four cells; each level above is built
+    # from the one below, with np.unique finding the distinct squares so only
+    # those are joined. A square is keyed by its quadrants' indices as digits
+    # in base len(nodes), which sorts far faster than rows of four.
+    def block(self, cells, level):
+        if not cells.any():
+            return self.zero(level)
+        square = np.zeros((1 << level, 1 << level), dtype=np.uint8)
+        square[:cells.shape[0], :cells.shape[1]] = cells != 0
+        ids = square[0::2, 0::2] | (square[0::2, 1::2] << 1) | (square[1::2, 0::2] << 2) | (square[1::2, 1::2] << 3)
+        ids = ids.astype(np.int64)
+        nodes = self.squares
+        for _ in range(level - 1):
+            n = len(nodes)
+            keys = ((ids[0::2, 0::2] * n + ids[0::2, 1::2]) * n + ids[1::2, 0::2]) * n + ids[1::2, 1::2]
+            unique, inverse = np.unique(keys, return_inverse=True)
+            nodes = [self.join(nodes[a], nodes[b], nodes[c], nodes[d])
+                     for a, b, c, d in zip(unique // n**3, unique // n**2 % n, unique // n % n, unique % n)]
+            ids = inverse.reshape(keys.shape)
+        return nodes[ids[0, 0]]
+
+    # The width x height window of the plane with its top-left cell at (x, y),
+    # as a grid like create_grid()'s
+    def get_grid(self, x, y, width, height):
+        grid = np.zeros((height, width), dtype=int)
+        stack = [(self.root, self.x - x, self.y - y)]
+        while stack:
+            node, left, top = stack.pop()
+            size = 1 << node.level
+            if node.population == 0 or left >= width or top >= height or left + size <= 0 or top + size <= 0:
+                continue
+            if node.level == 0:
+                grid[top, left] = 1
+                continue
+            half = size >> 1
+            stack.extend(((node.nw, left, top), (node.ne, left + half, top),
+                          (node.sw, left, top + half), (node.se, left + half, top + half)))
+        return grid
+
+    def population(self):
+        return self.root.population
+
+# The board is drawn into a persistent surface, cell x of row y being the
+# cell x cell square at (x * cell, y * cell). Its pixels, seen through strides
+# as (grid width, cell, grid height, cell), take the colour of every cell in
+# one broadcast assignment that skips a 1px gutter around each. The gutters
+# are filled once, when the surface is made. A board of a different size than
+# the screen is scaled to it in the blit.
+board = None
+
+def board_fits(width, height, cell):
+    return board is not None and board.get_size() == (width * cell, height * cell)
+
+# Paints grid into the board with its top-left cell at cell (x0, y0)
+def paint_cells(grid, x0, y0, cell):
+    height, width = grid.shape
+    colours = np.array([board.map_rgb((255, 255, 255)), board.map_rgb((0, 0, 0))], dtype=np.uint32)
+    pixels = pygame.surfarray.pixels2d(board)
+    sx, sy = pixels.strides
+    cells = np.lib.stride_tricks.as_strided(pixels[x0 * cell:, y0 * cell:], (width, cell, height, cell),
+                                            (sx * cell, sx, sy * cell, sy))
+    cells[:, 1:-1, :, 1:-1] = colours[grid.T][:, None, :, None]
+    del cells, pixels
+
+def blit_board(screen):
+    if board.get_size() == screen.get_size():
+        screen.blit(board, (0, 0))
+    else:
+        screen.blit(pygame.transform.scale(board, screen.get_size()), (0, 0))
+
+def draw_grid(screen, grid, cell=CELL_SZ):
+    global board
+    height, width = grid.shape
+    if not board_fits(width, height, cell):
+        board = pygame.Surface((width * cell, height * cell), depth=32)
+        board.fill(LIGHT_GRAY)
+    paint_cells(grid, 0, 0, cell)
+    blit_board(screen)
+
+# The view of the unbounded plane. At zoom z >= 0 a cell is 2^z pixels
+# across; below that a pixel covers 2^-z x 2^-z cells and is shaded by how
+# many of them live. (left, top) is the cell at the screen's top-left corner.
+MIN_ZOOM = -6
+MAX_ZOOM = 5
+
+# The live cells in each 2^shift square block of the view, counts being
+# (columns, rows) of blocks. Only chunks in the view are looked at, and in
+# them only the set bits.
+@jit(nopython=True, nogil=True, cache=True)
+def block_counts(keys, chunks, left, top, shift, counts):
+    columns, rows = counts.shape
+    for i in range(len(keys)):
+        cx = (keys[i] + (1 << 31)) >> 32
+        x0 = cx * CHUNK - left
+        y0 = (keys[i] - (cx << 32)) * CHUNK - top
+        if x0 >= columns << shift or y0 >= rows << shift or x0 + CHUNK <= 0 or y0 + CHUNK <= 0:
+            continue
+        for y in range(CHUNK):
+            by = (y0 + y) >> shift
+            word = chunks[i, y]
+            if word == 0 or by < 0 or by >= rows:
+                continue
+            for b in range(CHUNK):
+                if (word >> np.uint64(b)) & ONE:
+                    bx = (x0 + b) >> shift
+                    if 0 <= bx < columns:
+                        counts[bx, by] += 1
+    return counts
+
+class View:
+    def __init__(self, left=0, top=0, zoom=3):
+        self.left = left
+        self.top = top
+        self.zoom = zoom
+        self.luts = {}
+
+    # Cells per pixel along each axis
+    def scale(self):
+        return 2.0 ** -self.zoom
+
+    def cell_at(self, pos):
+        return (self.left + math.floor(pos[0] * self.scale()), self.top + math.floor(pos[1] * self.scale()))
+
+    def pan(self, dx, dy):
+        self.left -= math.floor(dx * self.scale())
+        self.top -= math.floor(dy * self.scale())
+
+    # Zooms in (steps > 0) or out about the cell under pos
+    def zoom_at(self, pos, steps):
+        x = self.left + pos[0] * self.scale()
+        y = self.top + pos[1] * self.scale()
+        self.zoom = min(max(self.zoom + steps, MIN_ZOOM), MAX_ZOOM)
+        self.left = math.floor(x - pos[0] * self.scale())
+        self.top = math.floor(y - pos[1] * self.scale())
+
+    # Live cells are black and empty ones white, as on the board; a block
+    # with any live cell is at least mid grey so lone cells still show
+    # zoomed out. The ramp for blocks of full cells is mapped to screen
+    # pixels once, like Colorizer.map_colors() in Mandlebrot.py.
+    def grey_lut(self, screen, full):
+        key = (full, screen.get_shifts())
+        lut = self.luts.get(key)
+        if lut is None:
+            greys = 160 - 160 * np.arange(full + 1) // full
+            greys[0] = 255
+            lut = self.luts[key] = pygame.surfarray.map_array(screen, np.repeat(greys, 3).reshape(-1, 1, 3)) \
+                .reshape(-1).astype(np.uint32)
+        return lut
+
+    # Each block's count is gathered through grey_lut(). Cells of 4px and up
+    # get the board's gutters.
+    def draw(self, screen, life):
+        width, height = screen.get_size()
+        shift = max(-self.zoom, 0)
+        size = 1 << max(self.zoom, 0)
+        counts = np.zeros((-(-width // size), -(-height // size)), dtype=np.int32)
+        block_counts(life.keys, life.chunks, self.left, self.top, shift, counts)
+        colours = self.grey_lut(screen, 1 << (2 * shift))[counts]
+        pixels = pygame.surfarray.pixels2d(screen)
+        if size == 1:
+            pixels[:] = colours
+        else:
+            pixels[:] = colours.repeat(size, axis=0)[:width].repeat(size, axis=1)[:, :height]
+            if size >= 4:
+                grey = screen.map_rgb(LIGHT_GRAY)
+                pixels[(np.arange(width) % size) % (size - 1) == 0] = grey
+                pixels[:, (np.arange(height) % size) % (size - 1) == 0] = grey
+        del pixels
 
 def setup():
     global screen
@@ -54,15 +760,18 @@ def save_screen(screen):
 
 def main():
     global generation
-    grid = setup()
+    life = PackedLife(setup())
+    # Key u swaps the board for the unbounded plane, and back. The plane pans
+    # with the arrow keys or a right-button drag and zooms with the wheel.
+    plane = None
+    view = View()
+    drag = None
     clock = pygame.time.Clock()
     running = True
     paused = False
     
     font = pygame.font.Font(None, 36)
 
-    LIGHT_GRAY = (200, 200, 200)
-
     while running:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
@@ -71,27 +780,62 @@ def main():
                 if event.key == pygame.K_SPACE:
                     paused = not paused
                 elif event.key == pygame.K_c and paused:
-                    grid = np.zeros((grid_h, grid_w), dtype=int)
+                    (life if plane is None else plane).clear()
                     generation = 0
                 elif event.key == pygame.K_r and paused:
-                    grid = create_grid()
+                    (life if plane is None else plane).set_grid(create_grid())
                     generation = 0
                 elif event.key == pygame.K_s:
                     save_screen(screen)
-            elif event.type == pygame.MOUSEBUTTONDOWN and paused:
-                if event.button == 1:  # Left mouse button
-                    x, y = event.pos
-                    grid_x, grid_y = x // CELL_SZ, y // CELL_SZ
-                    grid[grid_y, grid_x] = 1 - grid[grid_y, grid_x]  # Toggle cell state
+                elif event.key == pygame.K_u:
+                    if plane is None:
+                        plane = SparseLife()
+                        plane.set_grid(life.grid())
+                        view = View()
+                    else:
+                        # Cells off the board are dropped
+                        life.set_grid(plane.get_grid(0, 0, grid_w, grid_h))
+                        plane = None
+                elif event.key in (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN) and plane is not None:
+                    dx = {pygame.K_LEFT: 1, pygame.K_RIGHT: -1}.get(event.key, 0)
+                    dy = {pygame.K_UP: 1, pygame.K_DOWN: -1}.get(event.key, 0)
+                    view.pan(dx * WIDTH // 8, dy * HEIGHT // 8)
+                elif event.key == pygame.K_j and plane is None:
+                    # HashLife's plane does not wrap: cells that leave the
+                    # window are dropped
+                    hashlife = HashLife()
+                    hashlife.set_grid(life.grid())
+                    hashlife.step(JUMP)
+                    life.set_grid(hashlife.get_grid(0, 0, grid_w, grid_h))
+                    generation += 1 << JUMP
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                if event.button == 1 and paused:  # Left mouse button
+                    if plane is None:
+                        x, y = event.pos
+                        grid_x, grid_y = x // CELL_SZ, y // CELL_SZ
+                        life.toggle(grid_x, grid_y)  # Toggle cell state
+                    elif view.zoom >= 0:
+                        plane.toggle(*view.cell_at(event.pos))
+                elif event.button == 3 and plane is not None:
+                    drag = event.pos, view.left, view.top
+            elif event.type == pygame.MOUSEBUTTONUP and event.button == 3:
+                drag = None
+            elif event.type == pygame.MOUSEMOTION and drag is not None:
+                (x, y), view.left, view.top = drag
+                view.pan(event.pos[0] - x, event.pos[1] - y)
+            elif event.type == pygame.MOUSEWHEEL and plane is not None:
+                view.zoom_at(pygame.mouse.get_pos(), event.y)
 
         if not paused:
-            grid = update(grid)
+            (life if plane is None else plane).step()
             generation += 1
 
-        screen.fill(LIGHT_GRAY)
-        draw_grid(screen, grid)
-
-        gen_text = font.render(f"Generation: {generation}", True, (0, 0, 0))
+        if plane is None:
+            life.draw(screen)
+            gen_text = font.render(f"Generation: {generation}", True, (0, 0, 0))
+        else:
+            view.draw(screen, plane)
+            gen_text = font.render(f"Generation: {generation}   Population: {plane.population()}", True, (0, 0, 0))
         screen.blit(gen_text, (10, 10))
 
         paused_text = font.render("PAUSED" if paused else "RUNNING", True, (255, 0, 0) if paused else (0, 255, 0))
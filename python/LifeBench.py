@@ -0,0 +1,287 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import time
+import numpy as np
+import pygame
+import GameOfLife
+from GameOfLife import (create_grid, update, pack, unpack, update_packed, PackedLife, SparseLife, HashLife,
+                        draw_grid, block_counts, View, LIGHT_GRAY)
+
+GENERATIONS = 50
+
+def best_time(fn, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# update() sizes its grids from the module's grid_w and grid_h
+def reference_run(grid, generations):
+    size = GameOfLife.grid_h, GameOfLife.grid_w
+    GameOfLife.grid_h, GameOfLife.grid_w = grid.shape
+    grids = []
+    for _ in range(generations):
+        grid = update(grid)
+        grids.append(grid)
+    GameOfLife.grid_h, GameOfLife.grid_w = size
+    return grids
+
+def check_packed():
+    # Widths inside one word, on a word boundary and with a partial last word,
+    # random soup with a glider in the corner that wraps
+    for height, width in ((1, 1), (3, 5), (17, 64), (40, 128), (100, 190), (33, 300)):
+        grid = (np.random.random((height, width)) < 0.3).astype(int)
+        if height >= 5 and width >= 5:
+            grid[:5, :5] = 0
+            grid[0, 1] = grid[1, 2] = grid[2, 0] = grid[2, 1] = grid[2, 2] = 1
+        expected = reference_run(grid, GENERATIONS)
+        cells = pack(grid)
+        assert np.array_equal(unpack(cells, width), grid), f"pack/unpack changes a {width}x{height} grid"
+        spare = np.empty_like(cells)
+        for generation, reference in enumerate(expected):
+            cells, spare = update_packed(cells, width, spare), cells
+            assert np.array_equal(unpack(cells, width), reference), \
+                f"update_packed differs from update on {width}x{height} at generation {generation + 1}"
+    print(f"update_packed matches update over {GENERATIONS} generations")
+
+def bench_packed():
+    grid = create_grid()
+    reference = best_time(lambda: update(grid))
+    cells = pack(grid)
+    packed = best_time(lambda: update_packed(cells, grid.shape[1]))
+    print(f"{grid.shape[1]}x{grid.shape[0]}: update {reference * 1000:.2f} ms, "
+          f"update_packed {packed * 1000:.3f} ms, {reference / packed:.0f}x")
+
+    size = 10000
+    cells = pack(np.random.random((size, size)) < 0.2)
+    spare = np.empty_like(cells)
+    update_packed(cells, size, spare)
+    start = time.perf_counter()
+    for _ in range(10):
+        cells, spare = update_packed(cells, size, spare), cells
+    elapsed = (time.perf_counter() - start) / 10
+    print(f"{size}x{size}: {elapsed * 1000:.1f} ms per generation, {1 / elapsed:.1f} generations/s")
+
+# Long enough for soups to settle into mostly inactive tiles, with cells
+# toggled along the way, twice in a row so one lands on a tile the other just woke
+def check_tiles():
+    for height, width in ((5, 3), (40, 64), (100, 190), (70, 300)):
+        grid = (np.random.random((height, width)) < 0.3).astype(int)
+        life = PackedLife(grid)
+        cells = pack(grid)
+        for generation in range(600):
+            if generation % 150 in (148, 149):
+                x, y = np.random.randint(width), np.random.randint(height)
+                life.toggle(x, y)
+                cells[y, x // 64] ^= np.uint64(1) << np.uint64(x % 64)
+            life.step()
+            cells = update_packed(cells, width)
+            assert np.array_equal(life.cells, cells), \
+                f"PackedLife differs from update_packed on {width}x{height} at generation {generation + 1}"
+    print("PackedLife matches update_packed with only active tiles stepped")
+
+def check_dirty():
+    life = PackedLife(create_grid())
+    screen = pygame.Surface((GameOfLife.WIDTH, GameOfLife.HEIGHT), depth=32)
+    expected = screen.copy()
+    for generation in range(200):
+        life.step()
+        if generation % 7 == 0:
+            life.draw(screen)
+            draw_rects(expected, life.grid(), GameOfLife.CELL_SZ)
+            assert np.array_equal(pygame.surfarray.pixels2d(screen), pygame.surfarray.pixels2d(expected)), \
+                f"dirty tiles missed at generation {generation + 1}"
+    print("PackedLife.draw repaints every changed tile")
+
+GLIDER = np.array([[0, 1, 0],
+                   [0, 0, 1],
+                   [1, 1, 1]])
+
+# HashLife's plane does not wrap, so the reference runs on a torus wide enough
+# that the soup in the middle never reaches its edges
+def check_hashlife():
+    size, soup = 256, 48
+    grid = np.zeros((size, size), dtype=int)
+    grid[104:104 + soup, 104:104 + soup] = np.random.random((soup, soup)) < 0.35
+    expected = reference_run(grid, 64)
+    # The small table forces garbage collections in the middle of steps
+    for max_nodes in (1000000, 4000):
+        life = HashLife(max_nodes)
+        life.set_grid(grid)
+        assert np.array_equal(life.get_grid(0, 0, size, size), grid), "set_grid/get_grid changes the grid"
+        done = 0
+        for generations in (1, 2, 5, 8, 16, 32):
+            life.advance(generations)
+            done += generations
+            assert np.array_equal(life.get_grid(0, 0, size, size), expected[done - 1]), \
+                f"HashLife differs from update at generation {done} with max_nodes={max_nodes}"
+    # A glider moves one cell diagonally every four generations
+    life = HashLife()
+    life.set_grid(GLIDER, 10, 20)
+    life.step(40)
+    shift = (1 << 40) // 4
+    assert life.population() == 5, "glider lost cells"
+    assert np.array_equal(life.get_grid(10 + shift, 20 + shift, 3, 3), GLIDER), "glider is not where it should be"
+    print("HashLife matches update and moves a glider 2^40 generations")
+
+def bench_hashlife():
+    life = HashLife()
+    grid = create_grid()
+    life.set_grid(grid)
+    start = time.perf_counter()
+    for k in range(31):
+        life.step(k)
+    elapsed = time.perf_counter() - start
+    print(f"{grid.shape[1]}x{grid.shape[0]} soup: {life.generation} generations in {elapsed:.1f} s, "
+          f"population {life.population()}, {len(life.table)} nodes")
+
+# Like check_hashlife(), with the soup straddling the origin so chunks with
+# negative coordinates are stepped too
+def check_sparse():
+    size, soup, x, y = 256, 48, -128, -100
+    grid = np.zeros((size, size), dtype=int)
+    grid[104:104 + soup, 104:104 + soup] = np.random.random((soup, soup)) < 0.35
+    life = SparseLife()
+    life.set_grid(grid, x, y)
+    assert np.array_equal(life.get_grid(x, y, size, size), grid), "set_grid/get_grid changes the grid"
+    for generation in range(200):
+        if generation % 50 == 49:
+            cx, cy = np.random.randint(104, 104 + soup, 2)
+            life.toggle(x + cx, y + cy)
+            grid[cy, cx] ^= 1
+        life.step()
+        grid = reference_run(grid, 1)[0]
+        assert np.array_equal(life.get_grid(x, y, size, size), grid), \
+            f"SparseLife differs from update at generation {generation + 1}"
+    # A glider far from where it started keeps to the few chunks it is in
+    life.set_grid(GLIDER, -2, -2)
+    for _ in range(4 * 1000):
+        life.step()
+    assert len(life.keys) <= 4 and life.population() == 5, "glider left chunks behind"
+    assert np.array_equal(life.get_grid(998, 998, 3, 3), GLIDER), "glider is not where it should be"
+    print("SparseLife matches update and keeps a glider to its chunks")
+
+def check_view():
+    life = SparseLife()
+    life.set_grid(np.random.random((300, 500)) < 0.2, -200, -70)
+    for left, top, shift in ((-230, -90, 0), (-230, -90, 2), (-201, -3, 3), (100, 100, 5)):
+        counts = block_counts(life.keys, life.chunks, left, top, shift, np.zeros((40, 30), dtype=np.int32))
+        block = 1 << shift
+        grid = life.get_grid(left, top, 40 * block, 30 * block)
+        expected = grid.reshape(30, block, 40, block).sum(axis=(1, 3)).T
+        assert np.array_equal(counts, expected), f"block_counts wrong at ({left}, {top}) with shift {shift}"
+    view = View(-230, -90, 3)
+    assert view.cell_at((17, 9)) == (-228, -89), "cell_at misses the cell under the pointer"
+    view.zoom_at((400, 300), -4)
+    assert view.cell_at((400, 300)) == (-230 + 50, -90 + 37), "zoom_at moves the cell under the pointer"
+    print("View counts the cells in each block")
+
+# The Gosper glider gun, which fires a glider every 30 generations
+GUN = np.array([[c == "O" for c in row] for row in (
+    "........................O...........",
+    "......................O.O...........",
+    "............OO......OO............OO",
+    "...........O...O....OO............OO",
+    "OO........O.....O...OO..............",
+    "OO........O...O.OO....O.O...........",
+    "..........O.....O.......O...........",
+    "...........O...O....................",
+    "............OO......................")], dtype=int)
+
+# Step cost follows the growing stream of gliders, not the area it spans
+def bench_sparse():
+    life = SparseLife()
+    life.set_grid(GUN)
+    screen = pygame.Surface((GameOfLife.WIDTH, GameOfLife.HEIGHT), depth=32)
+    done = 0
+    for generations in (1000, 4000, 16000):
+        while done < generations:
+            life.step()
+            done += 1
+        stepped = best_time(life.step, 5)
+        done += 5
+        print(f"gun after {done:>5} generations: population {life.population():>5}, {len(life.keys):>4} chunks, "
+              f"step {stepped * 1000:.2f} ms, spanning {done // 4} cells")
+    for zoom in (3, 0, -4):
+        view = View(-GameOfLife.WIDTH >> max(zoom, 0), -GameOfLife.HEIGHT >> max(zoom, 0), zoom)
+        drawn = best_time(lambda: view.draw(screen, life))
+        print(f"view at zoom {zoom:>2}: {drawn * 1000:.2f} ms")
+
+# The per-cell drawing draw_grid() replaced
+def draw_rects(screen, grid, cell):
+    screen.fill(LIGHT_GRAY)
+    for y in range(grid.shape[0]):
+        for x in range(grid.shape[1]):
+            color = (0, 0, 0) if grid[y, x] else (255, 255, 255)
+            pygame.draw.rect(screen, color, (x * cell + 1, y * cell + 1, cell - 2, cell - 2))
+
+def check_draw():
+    grid = create_grid()
+    screen = pygame.Surface((grid.shape[1] * GameOfLife.CELL_SZ, grid.shape[0] * GameOfLife.CELL_SZ), depth=32)
+    expected = screen.copy()
+    draw_rects(expected, grid, GameOfLife.CELL_SZ)
+    for _ in range(2):
+        draw_grid(screen, grid)
+        assert np.array_equal(pygame.surfarray.pixels2d(screen), pygame.surfarray.pixels2d(expected)), \
+            "draw_grid differs from per-cell rects"
+        grid = 1 - grid
+        draw_rects(expected, grid, GameOfLife.CELL_SZ)
+    print("draw_grid matches per-cell rects pixel for pixel")
+
+def bench_draw():
+    screen = pygame.Surface((GameOfLife.WIDTH, GameOfLife.HEIGHT), depth=32)
+    grid = create_grid()
+    rects = best_time(lambda: draw_rects(screen, grid, GameOfLife.CELL_SZ))
+    board = best_time(lambda: draw_grid(screen, grid))
+    print(f"{grid.shape[1]}x{grid.shape[0]} cells: rects {rects * 1000:.1f} ms, draw_grid {board * 1000:.2f} ms")
+    # Ten times the cells at 3px, and the same grid as 10px cells scaled down
+    grid = (np.random.random((GameOfLife.HEIGHT // 3, GameOfLife.WIDTH // 3)) < 0.2).astype(np.uint8)
+    board = best_time(lambda: draw_grid(screen, grid, 3))
+    scaled = best_time(lambda: draw_grid(screen, grid))
+    print(f"{grid.shape[1]}x{grid.shape[0]} cells: draw_grid {board * 1000:.2f} ms at 3px, "
+          f"{scaled * 1000:.2f} ms at 10px scaled to the screen")
+
+# Steady state: a soup run until it has mostly settled
+def bench_tiles():
+    size = 4096
+    life = PackedLife((np.random.random((size, size)) < 0.2).astype(np.uint8))
+    for generations in (0, 1000, 4000):
+        for _ in range(generations):
+            life.step()
+        active = GameOfLife.active_tiles(life.changed).mean()
+        spare = np.empty_like(life.cells)
+        full = best_time(lambda: update_packed(life.cells, size, spare), 5)
+        stepped = best_time(life.step, 5)
+        print(f"{size}x{size} after {generations:>4} more generations: {active * 100:5.1f}% tiles active, "
+              f"update_packed {full * 1000:.2f} ms, PackedLife.step {stepped * 1000:.2f} ms")
+
+    screen = pygame.Surface((GameOfLife.WIDTH, GameOfLife.HEIGHT), depth=32)
+    life = PackedLife(create_grid())
+    for _ in range(2000):
+        life.step()
+    life.draw(screen)
+    life.step()
+    dirty = best_time(lambda: life.draw(screen))
+    full = best_time(lambda: draw_grid(screen, life.grid()))
+    print(f"{GameOfLife.grid_w}x{GameOfLife.grid_h} settled: draw_grid {full * 1000:.2f} ms, "
+          f"dirty tiles {dirty * 1000:.2f} ms")
+
+def main():
+    check_packed()
+    check_tiles()
+    check_hashlife()
+    check_sparse()
+    check_view()
+    check_draw()
+    check_dirty()
+    bench_packed()
+    bench_tiles()
+    bench_hashlife()
+    bench_sparse()
+    bench_draw()
+
+if __name__ == "__main__":
+    main()
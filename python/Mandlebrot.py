@@ -1,12 +1,18 @@
 import pygame
 import numpy as np
-from numba import jit
+from numba import jit, prange, get_num_threads
 from enum import Enum
 import os
+import math
+import copy
+import threading
+from collections import OrderedDict, deque
+import csv
+from decimal import Decimal, localcontext
 from datetime import datetime
 import time
 
-@jit(nopython=True)
+@jit(nopython=True, nogil=True, cache=True)
 def mandelbrot(width, height, corner1, scaleReal, scaleImag, itsMaxIter):
     pixel_data = np.zeros((width, height), dtype=np.uint16)
 
@@ -23,7 +29,7 @@ def mandelbrot(width, height, corner1, scaleReal, scaleImag, itsMaxIter):
 
     return pixel_data
 
-@jit(nopython=True)
+@jit(nopython=True, nogil=True, cache=True)
 def julia(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter):
     pixel_data = np.zeros((width, height), dtype=np.uint16)
 
@@ -40,8 +46,729 @@ def julia(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter):
 
     return pixel_data
 
+@jit(nopython=True, nogil=True, cache=True)
+def escape_time(z, c, itsMaxIter):
+    for n in range(itsMaxIter):
+        if abs(z) > 2.0:
+            return n
+        z = z * z + c
+    return itsMaxIter
+
+# Columns are dealt out round-robin, one lane per thread, so that columns
+# full of interior points are shared evenly between the cores. Callers pass
+# the lane count, get_num_threads() at the time of the call: read inside a
+# kernel it would keep the kernel out of the on-disk cache.
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def mandelbrot_parallel(width, height, corner1, scaleReal, scaleImag, itsMaxIter, lanes):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                c = corner1 + complex(x * scaleReal, y * scaleImag)
+                pixel_data[x, y] = escape_time(0j, c, itsMaxIter)
+
+    return pixel_data
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def julia_parallel(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter, lanes):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                z = corner1 + complex(x * scaleReal, y * scaleImag)
+                pixel_data[x, y] = escape_time(z, C, itsMaxIter)
+
+    return pixel_data
+
+# Escape time on split real/imaginary parts. |z|^2 is compared against a bound
+# just under 4 instead of taking abs(z) every iteration; only the candidates
+# that pass are confirmed with hypot(), so rounding right on the circle goes the
+# same way as abs(z) does. Points in the main cardioid or the period-2 bulb are
+# rejected analytically. For the rest, Brent's method saves z at doubling
+# intervals and stops as soon as the orbit returns to it exactly: an orbit
+# that repeats can never escape, so the counts match escape_time().
+# The *_orbit functions also return |z|^2 at escape for smooth colouring.
+@jit(nopython=True, nogil=True, cache=True)
+def mandelbrot_orbit(cr, ci, itsMaxIter):
+    if main_bulbs(cr, ci):
+        return itsMaxIter, 0.0
+    return orbit(0.0, 0.0, cr, ci, itsMaxIter)
+
+# Whether c is in the main cardioid or the period-2 bulb
+@jit(nopython=True, nogil=True, cache=True)
+def main_bulbs(cr, ci):
+    ci2 = ci * ci
+    q = (cr - 0.25) * (cr - 0.25) + ci2
+    return q * (q + (cr - 0.25)) <= 0.25 * ci2 or (cr + 1.0) * (cr + 1.0) + ci2 <= 0.0625
+
+@jit(nopython=True, nogil=True, cache=True)
+def mandelbrot_point(cr, ci, itsMaxIter):
+    return mandelbrot_orbit(cr, ci, itsMaxIter)[0]
+
+@jit(nopython=True, nogil=True, cache=True)
+def orbit_time(zr, zi, cr, ci, itsMaxIter):
+    return orbit(zr, zi, cr, ci, itsMaxIter)[0]
+
+@jit(nopython=True, nogil=True, cache=True)
+def orbit(zr, zi, cr, ci, itsMaxIter):
+    oldr = zr
+    oldi = zi
+    steps = 0
+    limit = 2
+    for n in range(itsMaxIter):
+        zr2 = zr * zr
+        zi2 = zi * zi
+        if zr2 + zi2 > 3.9999999 and math.hypot(zr, zi) > 2.0:
+            return n, zr2 + zi2
+        zi = 2.0 * zr * zi + ci
+        zr = zr2 - zi2 + cr
+        if zr == oldr and zi == oldi:
+            return itsMaxIter, 0.0
+        steps += 1
+        if steps == limit:
+            oldr = zr
+            oldi = zi
+            steps = 0
+            limit *= 2
+    return itsMaxIter, 0.0
+
+# Normalized iteration count n + 1 - log2(log2|z|), continuous across the
+# bands of the escape time. Points that never escape keep itsMaxIter.
+@jit(nopython=True, nogil=True, cache=True)
+def smooth_value(n, mag2, itsMaxIter):
+    if n >= itsMaxIter:
+        return np.float32(itsMaxIter)
+    return np.float32(max(0.0, n + 1 - math.log2(0.5 * math.log2(mag2))))
+
+# Passing a float32 array as smooth fills it with smooth_value() as well
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def mandelbrot_optimized(width, height, corner1, scaleReal, scaleImag, itsMaxIter, lanes, smooth=None):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                c = corner1 + complex(x * scaleReal, y * scaleImag)
+                n, mag2 = mandelbrot_orbit(c.real, c.imag, itsMaxIter)
+                pixel_data[x, y] = n
+                if smooth is not None:
+                    smooth[x, y] = smooth_value(n, mag2, itsMaxIter)
+
+    return pixel_data
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def julia_optimized(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter, lanes, smooth=None):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                z = corner1 + complex(x * scaleReal, y * scaleImag)
+                n, mag2 = orbit(z.real, z.imag, C.real, C.imag, itsMaxIter)
+                pixel_data[x, y] = n
+                if smooth is not None:
+                    smooth[x, y] = smooth_value(n, mag2, itsMaxIter)
+
+    return pixel_data
+
+# float32 kernels for shallow zooms. A column is cut into blocks of LANES
+# pixels that iterate in lockstep on split real/imaginary arrays, with no
+# branch per lane, so LLVM can vectorize the inner loop. A lane counts the
+# iterations it spends inside |z| <= 2; once out, z runs off to inf and NaN
+# and is never counted again. A block stops when all of its lanes are out.
+# Points in the main cardioid or period-2 bulb are given c = 4 so they leave
+# at once, and get itsMaxIter afterwards. Because escaped lanes do reach inf
+# and NaN, fastmath leaves out nnan and ninf; FMA contraction is kept.
+LANES = 16
+
+@jit(nopython=True, nogil=True, cache=True, fastmath={'reassoc', 'contract', 'arcp'})
+def lockstep(zr, zi, cr, ci, count, itsMaxIter):
+    count[:] = 0
+    for n in range(itsMaxIter):
+        alive = 0
+        for k in range(LANES):
+            zr2 = zr[k] * zr[k]
+            zi2 = zi[k] * zi[k]
+            inside = zr2 + zi2 <= np.float32(4.0)
+            count[k] += inside
+            alive += inside
+            zi[k] = np.float32(2.0) * zr[k] * zi[k] + ci[k]
+            zr[k] = zr2 - zi2 + cr[k]
+        if alive == 0:
+            break
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def mandelbrot_float32(width, height, corner1, scaleReal, scaleImag, itsMaxIter, lanes):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        zr = np.empty(LANES, dtype=np.float32)
+        zi = np.empty(LANES, dtype=np.float32)
+        cr = np.empty(LANES, dtype=np.float32)
+        ci = np.empty(LANES, dtype=np.float32)
+        count = np.empty(LANES, dtype=np.int32)
+        interior = np.empty(LANES, dtype=np.bool_)
+        for x in range(lane, width, lanes):
+            for y0 in range(0, height, LANES):
+                todo = 0
+                for k in range(LANES):
+                    # Lanes past the bottom repeat the last row
+                    c = corner1 + complex(x * scaleReal, min(y0 + k, height - 1) * scaleImag)
+                    q = (c.real - 0.25) * (c.real - 0.25) + c.imag * c.imag
+                    interior[k] = (q * (q + (c.real - 0.25)) <= 0.25 * c.imag * c.imag or
+                                   (c.real + 1.0) * (c.real + 1.0) + c.imag * c.imag <= 0.0625)
+                    cr[k] = 4.0 if interior[k] else c.real
+                    ci[k] = 0.0 if interior[k] else c.imag
+                    zr[k] = 0.0
+                    zi[k] = 0.0
+                    todo += not interior[k]
+                if todo > 0:
+                    lockstep(zr, zi, cr, ci, count, itsMaxIter)
+                for k in range(min(LANES, height - y0)):
+                    pixel_data[x, y0 + k] = itsMaxIter if interior[k] else count[k]
+
+    return pixel_data
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def julia_float32(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter, lanes):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        zr = np.empty(LANES, dtype=np.float32)
+        zi = np.empty(LANES, dtype=np.float32)
+        cr = np.full(LANES, C.real, dtype=np.float32)
+        ci = np.full(LANES, C.imag, dtype=np.float32)
+        count = np.empty(LANES, dtype=np.int32)
+        for x in range(lane, width, lanes):
+            for y0 in range(0, height, LANES):
+                for k in range(LANES):
+                    z = corner1 + complex(x * scaleReal, min(y0 + k, height - 1) * scaleImag)
+                    zr[k] = z.real
+                    zi[k] = z.imag
+                lockstep(zr, zi, cr, ci, count, itsMaxIter)
+                for k in range(min(LANES, height - y0)):
+                    pixel_data[x, y0 + k] = count[k]
+
+    return pixel_data
+
+# Single-threaded julia_optimized() for small images rendered off the main
+# thread, where they run alongside the parallel kernels
+@jit(nopython=True, nogil=True, cache=True)
+def julia_small(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+
+    for x in range(width):
+        for y in range(height):
+            z = corner1 + complex(x * scaleReal, y * scaleImag)
+            pixel_data[x, y] = orbit_time(z.real, z.imag, C.real, C.imag, itsMaxIter)
+
+    return pixel_data
+
+# Mariani-Silver subdivision. Work starts from tiles of tile_size pixels,
+# dealt out to the threads. A rectangle whose border pixels all share one
+# iteration count is filled with it. Otherwise it is split in two across its
+# longer side, and small rectangles are computed pixel by pixel. Neighbouring
+# rectangles share their border rows and columns, so every border pixel is
+# computed once. UNSET marks pixels not yet computed.
+UNSET = 0xFFFF
+
+@jit(nopython=True, nogil=True, cache=True)
+def point_time(pixel_data, x, y, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter):
+    col = pixel_data[x, y]
+    if col == UNSET:
+        p = corner1 + complex(x * scaleReal, y * scaleImag)
+        if julia_mode:
+            col = orbit_time(p.real, p.imag, C.real, C.imag, itsMaxIter)
+        else:
+            col = mandelbrot_point(p.real, p.imag, itsMaxIter)
+        pixel_data[x, y] = col
+    return col
+
+@jit(nopython=True, nogil=True, cache=True)
+def subdivide(pixel_data, x0, y0, x1, y1, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter, min_size):
+    stack = np.empty((64, 4), dtype=np.int64)
+    stack[0] = (x0, y0, x1, y1)
+    top = 1
+    while top > 0:
+        top -= 1
+        x0, y0, x1, y1 = stack[top]
+
+        # Border, corners included; x1 and y1 are inclusive
+        first = point_time(pixel_data, x0, y0, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter)
+        uniform = True
+        for x in range(x0, x1 + 1):
+            if point_time(pixel_data, x, y0, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter) != first:
+                uniform = False
+            if point_time(pixel_data, x, y1, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter) != first:
+                uniform = False
+        for y in range(y0 + 1, y1):
+            if point_time(pixel_data, x0, y, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter) != first:
+                uniform = False
+            if point_time(pixel_data, x1, y, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter) != first:
+                uniform = False
+
+        if uniform:
+            pixel_data[x0 + 1:x1, y0 + 1:y1] = first
+        elif x1 - x0 <= min_size or y1 - y0 <= min_size:
+            for x in range(x0 + 1, x1):
+                for y in range(y0 + 1, y1):
+                    point_time(pixel_data, x, y, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter)
+        elif x1 - x0 >= y1 - y0:
+            xm = (x0 + x1) // 2
+            stack[top] = (x0, y0, xm, y1)
+            stack[top + 1] = (xm, y0, x1, y1)
+            top += 2
+        else:
+            ym = (y0 + y1) // 2
+            stack[top] = (x0, y0, x1, ym)
+            stack[top + 1] = (x0, ym, x1, y1)
+            top += 2
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def mariani_silver(width, height, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter,
+                   tile_size=64, min_size=4):
+    pixel_data = np.full((width, height), UNSET, dtype=np.uint16)
+    tiles_x = max(1, -(-(width - 1) // tile_size))
+    tiles_y = max(1, -(-(height - 1) // tile_size))
+
+    for tile in prange(tiles_x * tiles_y):
+        x0 = (tile % tiles_x) * tile_size
+        y0 = (tile // tiles_x) * tile_size
+        x1 = min(x0 + tile_size, width - 1)
+        y1 = min(y0 + tile_size, height - 1)
+        subdivide(pixel_data, x0, y0, x1, y1, corner1, C, julia_mode,
+                  scaleReal, scaleImag, itsMaxIter, min_size)
+
+    return pixel_data
+
+@jit(nopython=True, nogil=True, cache=True)
+def mandelbrot_subdivide(width, height, corner1, scaleReal, scaleImag, itsMaxIter):
+    return mariani_silver(width, height, corner1, 0j, False, scaleReal, scaleImag, itsMaxIter)
+
+@jit(nopython=True, nogil=True, cache=True)
+def julia_subdivide(width, height, corner1, C, scaleReal, scaleImag, itsMaxIter):
+    return mariani_silver(width, height, corner1, C, True, scaleReal, scaleImag, itsMaxIter)
+
+# Computes only the UNSET pixels of pixel_data, in round-robin column lanes
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def fill_unset(pixel_data, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter, lanes):
+    width, height = pixel_data.shape
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                point_time(pixel_data, x, y, corner1, C, julia_mode, scaleReal, scaleImag, itsMaxIter)
+
+    return pixel_data
+
+# Perturbation: pixels are iterated as float64 offsets dz from a reference
+# orbit Z computed in high precision at the view center, using
+# dz' = 2*Z*dz + dz^2 + dc. Whenever |Z + dz| drops below |dz| the offset has
+# lost its precision (a glitch), and the orbit is rebased onto the start of the
+# reference with dz = Z + dz - Z[0]. The same happens if the reference escapes
+# before the pixel does. This keeps one reference orbit valid for every pixel.
+@jit(nopython=True, nogil=True, cache=True)
+def perturbed_orbit(orbit, dc, julia_mode, itsMaxIter):
+    last = len(orbit) - 1
+    if julia_mode:
+        dz = dc
+        dc = 0j
+    else:
+        dz = 0j
+    m = 0
+    for n in range(itsMaxIter):
+        z = orbit[m] + dz
+        z2 = z.real * z.real + z.imag * z.imag
+        if z2 > 4.0:
+            return n, z2
+        if z2 < dz.real * dz.real + dz.imag * dz.imag or m == last:
+            dz = z - orbit[0]
+            m = 0
+        dz = (2.0 * orbit[m] + dz) * dz + dc
+        m += 1
+    return itsMaxIter, 0.0
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def perturbation(width, height, orbit, dcorner, julia_mode, scaleReal, scaleImag, itsMaxIter, lanes, smooth=None):
+    pixel_data = np.zeros((width, height), dtype=np.uint16)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                dc = dcorner + complex(x * scaleReal, y * scaleImag)
+                col, mag2 = perturbed_orbit(orbit, dc, julia_mode, itsMaxIter)
+                pixel_data[x, y] = col
+                if smooth is not None:
+                    smooth[x, y] = smooth_value(col, mag2, itsMaxIter)
+
+    return pixel_data
+
+def reference_orbit(center, c, julia_mode, itsMaxIter, digits):
+    orbit = np.zeros(itsMaxIter + 1, dtype=np.complex128)
+    with localcontext() as ctx:
+        ctx.prec = digits
+        zr, zi = center if julia_mode else (Decimal(0), Decimal(0))
+        cr, ci = c
+        for n in range(itsMaxIter + 1):
+            orbit[n] = complex(float(zr), float(zi))
+            zr2 = zr * zr
+            zi2 = zi * zi
+            if zr2 + zi2 > 4:
+                return orbit[:n + 1]
+            zr, zi = zr2 - zi2 + cr, 2 * zr * zi + ci
+    return orbit
+
+# Keeps the reference orbit of the last deep view, shared with the snapshots
+# handed to the renderer thread so that bands and passes reuse it.
+class ReferenceOrbit:
+    def __init__(self):
+        self.key = None
+        self.orbit = None
+        self.lock = threading.Lock()
+
+    def get(self, center, c, julia_mode, itsMaxIter, scale):
+        digits = max(30, 20 - int(math.log10(scale)))
+        key = (center, c, julia_mode, itsMaxIter, digits)
+        with self.lock:
+            if key != self.key:
+                self.orbit = reference_orbit(center, c, julia_mode, itsMaxIter, digits)
+                self.key = key
+            return self.orbit
+
+# Distance estimation. Along with z, the orbit carries its derivative dz/dc,
+# dz' = 2 z dz' + 1. An escaping point lies between a quarter and all of
+# 2 |z| log|z| / |dz'| from the set, and half of that is taken. A filament thinner
+# than a pixel escapes within a few iterations of its neighbours and barely
+# changes their counts, but it does shrink their distance to under a pixel,
+# so it shows at a fraction of the iterations escape time needs. The escape
+# radius is large because the estimate only converges as |z| grows. Points
+# that never escape get -1.
+DISTANCE_ESCAPE = 1e6
+
+@jit(nopython=True, nogil=True, cache=True)
+def distance_orbit(cr, ci, itsMaxIter):
+    ci2 = ci * ci
+    q = (cr - 0.25) * (cr - 0.25) + ci2
+    if q * (q + (cr - 0.25)) <= 0.25 * ci2:
+        return -1.0
+    if (cr + 1.0) * (cr + 1.0) + ci2 <= 0.0625:
+        return -1.0
+    zr = 0.0
+    zi = 0.0
+    dr = 0.0
+    di = 0.0
+    oldr = zr
+    oldi = zi
+    steps = 0
+    limit = 2
+    for n in range(itsMaxIter):
+        zr2 = zr * zr
+        zi2 = zi * zi
+        if zr2 + zi2 > DISTANCE_ESCAPE:
+            mag = math.sqrt(zr2 + zi2)
+            return mag * math.log(mag) / math.hypot(dr, di)
+        dr, di = 2.0 * (zr * dr - zi * di) + 1.0, 2.0 * (zr * di + zi * dr)
+        zi = 2.0 * zr * zi + ci
+        zr = zr2 - zi2 + cr
+        if zr == oldr and zi == oldi:
+            return -1.0
+        steps += 1
+        if steps == limit:
+            oldr = zr
+            oldi = zi
+            steps = 0
+            limit *= 2
+    return -1.0
+
+# Distances come out in units of pixel, the size of a full-resolution pixel,
+# so coarse passes colour the same as the final one
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def mandelbrot_distance(width, height, corner1, scaleReal, scaleImag, itsMaxIter, pixel, lanes):
+    distance = np.empty((width, height), dtype=np.float32)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                c = corner1 + complex(x * scaleReal, y * scaleImag)
+                d = distance_orbit(c.real, c.imag, itsMaxIter)
+                distance[x, y] = d / pixel if d >= 0.0 else -1.0
+
+    return distance
+
+# distance_orbit() around a reference orbit, as perturbed_orbit() does for counts
+@jit(nopython=True, nogil=True, cache=True)
+def perturbed_distance(orbit, dc, itsMaxIter):
+    last = len(orbit) - 1
+    dz = 0j
+    der = 0j
+    m = 0
+    for n in range(itsMaxIter):
+        z = orbit[m] + dz
+        z2 = z.real * z.real + z.imag * z.imag
+        if z2 > DISTANCE_ESCAPE:
+            mag = math.sqrt(z2)
+            return mag * math.log(mag) / abs(der)
+        if z2 < dz.real * dz.real + dz.imag * dz.imag or m == last:
+            dz = z - orbit[0]
+            m = 0
+        der = 2.0 * z * der + 1.0
+        dz = (2.0 * orbit[m] + dz) * dz + dc
+        m += 1
+    return -1.0
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def perturbation_distance(width, height, orbit, dcorner, scaleReal, scaleImag, itsMaxIter, pixel, lanes):
+    distance = np.empty((width, height), dtype=np.float32)
+    lanes = min(lanes, width)
+
+    for lane in prange(lanes):
+        for x in range(lane, width, lanes):
+            for y in range(height):
+                dc = dcorner + complex(x * scaleReal, y * scaleImag)
+                d = perturbed_distance(orbit, dc, itsMaxIter)
+                distance[x, y] = d / pixel if d >= 0.0 else -1.0
+
+    return distance
+
+# Adaptive anti-aliasing. Pixels whose colour differs by more than threshold
+# in any channel from one of their eight neighbours are sampled again on an
+# n x n grid, colours being the lut of rgb rows the counts are coloured
+# with. The grid puts one sample on the pixel's center, which takes the
+# pixel's own count. Samples cost their count, and may take budget times
+# what the frame's pixels cost in all, which is their count too except in
+# the main cardioid and period-2 bulb, where they cost nothing. Edge pixels go in
+# order of their largest colour step: every other sample in each direction
+# is computed for as many as the budget allows, then, while it lasts, the
+# rest of the grid where those disagree. Grids that are not completed take
+# the value of the sample before. Pixels the budget does not reach keep
+# their one sample. Returns the sampled pixels' coordinates and their
+# samples. A non-empty orbit means a deep view: corner1 is then the offset
+# of pixel (0, 0) from the reference, as for perturbation().
+@jit(nopython=True, nogil=True, cache=True)
+def sample_time(px, py, corner1, C, julia_mode, orbit, scaleReal, scaleImag, itsMaxIter):
+    p = corner1 + complex(px * scaleReal, py * scaleImag)
+    if len(orbit) > 0:
+        return perturbed_orbit(orbit, p, julia_mode, itsMaxIter)[0]
+    if julia_mode:
+        return orbit_time(p.real, p.imag, C.real, C.imag, itsMaxIter)
+    return mandelbrot_point(p.real, p.imag, itsMaxIter)
+
+@jit(nopython=True, nogil=True, cache=True)
+def colour_step(lut, a, b):
+    top = len(lut) - 1
+    a = min(a, top)
+    b = min(b, top)
+    step = 0
+    for c in range(3):
+        step = max(step, abs(np.int32(lut[a, c]) - np.int32(lut[b, c])))
+    return step
+
+@jit(nopython=True, nogil=True, cache=True, parallel=True)
+def supersample(pixel_data, lut, corner1, C, julia_mode, orbit, scaleReal, scaleImag, itsMaxIter,
+                n, threshold, budget, lanes):
+    width, height = pixel_data.shape
+    # Each pair of neighbours is compared once: steps holds the colour step
+    # to the right, below, below right and above right of each pixel
+    steps = np.zeros((4, width, height), dtype=np.uint8)
+    cost = 0
+    for x in prange(width):
+        for y in range(height):
+            col = pixel_data[x, y]
+            if col < itsMaxIter:
+                cost += col
+            elif julia_mode or len(orbit) > 0 or not main_bulbs(corner1.real + x * scaleReal,
+                                                                corner1.imag + y * scaleImag):
+                cost += itsMaxIter
+            d = 0
+            for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                nx = x + dx
+                ny = y + dy
+                if nx < width and 0 <= ny < height:
+                    other = pixel_data[nx, ny]
+                    if other != col:
+                        steps[d, x, y] = colour_step(lut, other, col)
+                d += 1
+    contrast = np.zeros((width, height), dtype=np.uint8)
+    for x in prange(width):
+        for y in range(height):
+            step = max(max(steps[0, x, y], steps[1, x, y]), max(steps[2, x, y], steps[3, x, y]))
+            if x > 0:
+                step = max(step, steps[0, x - 1, y])
+                if y > 0:
+                    step = max(step, steps[2, x - 1, y - 1])
+                if y + 1 < height:
+                    step = max(step, steps[3, x - 1, y + 1])
+            if y > 0:
+                step = max(step, steps[1, x, y - 1])
+            contrast[x, y] = step
+    xs, ys = np.nonzero(contrast > threshold)
+    order = np.argsort(-contrast[xs, ys].astype(np.int32), kind="mergesort")
+
+    centre = n // 2
+    samples = np.empty((len(xs), n * n), dtype=np.uint16)
+    sampled = np.zeros(len(xs), dtype=np.bool_)
+    lanes = min(lanes, max(len(xs), 1))
+    allowance = budget * cost / lanes
+    for lane in prange(lanes):
+        spent = 0
+        for r in range(lane, len(xs), lanes):
+            if spent >= allowance:
+                break
+            i = order[r]
+            for j in range(0, n, 2):
+                for k in range(0, n, 2):
+                    if j == centre and k == centre:
+                        samples[i, j * n + k] = pixel_data[xs[i], ys[i]]
+                    else:
+                        samples[i, j * n + k] = sample_time(xs[i] + (j - centre) / n, ys[i] + (k - centre) / n,
+                                                            corner1, C, julia_mode, orbit,
+                                                            scaleReal, scaleImag, itsMaxIter)
+                        spent += samples[i, j * n + k]
+            sampled[i] = True
+        # What is left of the budget completes the grids, in the same order
+        for r in range(lane, len(xs), lanes):
+            i = order[r]
+            if not sampled[i]:
+                break
+            first = samples[i, 0]
+            uniform = True
+            for j in range(0, n, 2):
+                for k in range(0, n, 2):
+                    if colour_step(lut, samples[i, j * n + k], first) > threshold:
+                        uniform = False
+            full = not uniform and spent < allowance
+            for j in range(n):
+                for k in range(n):
+                    if j % 2 == 0 and k % 2 == 0:
+                        continue
+                    if full:
+                        samples[i, j * n + k] = sample_time(xs[i] + (j - centre) / n, ys[i] + (k - centre) / n,
+                                                            corner1, C, julia_mode, orbit,
+                                                            scaleReal, scaleImag, itsMaxIter)
+                        spent += samples[i, j * n + k]
+                    else:
+                        samples[i, j * n + k] = samples[i, (j - j % 2) * n + k - k % 2]
+
+    return xs[sampled], ys[sampled], samples[sampled]
+
+# Colours smooth iteration values into mapped 32-bit pixels by blending the
+# two nearest palette entries. The last entry is kept for max_value alone.
+# Serial: colouring runs on the main thread while the renderer thread may be
+# inside a parallel kernel (see warm_up()), and it is bound by memory anyway.
+@jit(nopython=True, nogil=True, cache=True)
+def smooth_colours(smooth, palette, max_value, shifts, out):
+    top = len(palette) - 1
+    scaling = (top - 1) / max(max_value, 1.0)
+    for x in range(smooth.shape[0]):
+        for y in range(smooth.shape[1]):
+            v = smooth[x, y]
+            if v >= max_value:
+                r = palette[top, 0]
+                g = palette[top, 1]
+                b = palette[top, 2]
+            else:
+                t = v * scaling
+                i = min(int(t), top - 1)
+                j = min(i + 1, top - 1)
+                f = t - i
+                r = palette[i, 0] + f * (np.float32(palette[j, 0]) - palette[i, 0])
+                g = palette[i, 1] + f * (np.float32(palette[j, 1]) - palette[i, 1])
+                b = palette[i, 2] + f * (np.float32(palette[j, 2]) - palette[i, 2])
+            out[x, y] = (np.uint32(r) << shifts[0]) | (np.uint32(g) << shifts[1]) | (np.uint32(b) << shifts[2])
+
+# Colours counts into mapped 32-bit pixels through a lut of them; counts past
+# its end take the last entry. Serial, like smooth_colours().
+@jit(nopython=True, nogil=True, cache=True)
+def lut_colours(pixel_data, lut, out):
+    top = len(lut) - 1
+    for x in range(pixel_data.shape[0]):
+        for y in range(pixel_data.shape[1]):
+            out[x, y] = lut[min(pixel_data[x, y], top)]
+
+# Colours distances in pixels into mapped 32-bit pixels. Palette entries go
+# by log distance up to max_distance; within a pixel of the boundary they fade
+# to black, which draws the filaments. Points that never escaped take the last
+# entry. Serial, like smooth_colours().
+@jit(nopython=True, nogil=True, cache=True)
+def distance_colours(distance, palette, max_distance, shifts, out):
+    top = len(palette) - 1
+    scaling = (top - 1) / math.log2(1.0 + max_distance)
+    for x in range(distance.shape[0]):
+        for y in range(distance.shape[1]):
+            d = distance[x, y]
+            if d < 0.0:
+                r = palette[top, 0]
+                g = palette[top, 1]
+                b = palette[top, 2]
+            else:
+                i = min(int(math.log2(1.0 + d) * scaling), top - 1)
+                shade = min(d, 1.0)
+                r = palette[i, 0] * shade
+                g = palette[i, 1] * shade
+                b = palette[i, 2] * shade
+            out[x, y] = (np.uint32(r) << shifts[0]) | (np.uint32(g) << shifts[1]) | (np.uint32(b) << shifts[2])
+
+# Overwrites each supersampled pixel with the average colour of its samples.
+# Serial, like smooth_colours().
+@jit(nopython=True, nogil=True, cache=True)
+def antialias_colours(xs, ys, samples, lut, shifts, out):
+    top = len(lut) - 1
+    count = samples.shape[1]
+    for i in range(len(xs)):
+        r = 0
+        g = 0
+        b = 0
+        for s in range(count):
+            colour = lut[min(samples[i, s], top)]
+            r += (colour >> shifts[0]) & 0xFF
+            g += (colour >> shifts[1]) & 0xFF
+            b += (colour >> shifts[2]) & 0xFF
+        r = np.uint32((r + count // 2) // count)
+        g = np.uint32((g + count // 2) // count)
+        b = np.uint32((b + count // 2) // count)
+        out[xs[i], ys[i]] = (r << shifts[0]) | (g << shifts[1]) | (b << shifts[2])
+
+# Escape statistics of a finished frame for auto iterations: pixels that never
+# escaped, pixels that escaped in the top quarter below the cap, and the
+# highest count that did escape
+@jit(nopython=True, nogil=True, cache=True)
+def escape_stats(pixel_data, itsMaxIter):
+    never = 0
+    near = 0
+    highest = 0.0
+    limit = itsMaxIter * 3 // 4
+    for x in range(pixel_data.shape[0]):
+        for y in range(pixel_data.shape[1]):
+            v = pixel_data[x, y]
+            if v >= itsMaxIter:
+                never += 1
+            else:
+                if v >= limit:
+                    near += 1
+                highest = max(highest, float(v))
+    return never, near, highest
+
+# np.bincount would first copy the counts into an int64 array
+@jit(nopython=True, nogil=True, cache=True)
+def histogram(pixel_data, max_value):
+    counts = np.zeros(max_value + 1, dtype=np.int64)
+    for x in range(pixel_data.shape[0]):
+        for y in range(pixel_data.shape[1]):
+            counts[pixel_data[x, y]] += 1
+    return counts
+
 palette = None
-color_data = None
 pygame_surface = None
 preview_surface = None
 preview_enabled = False
@@ -50,6 +777,419 @@ class DrawingMode(Enum):
     NONE = 0
     MANDELBROT = 1
     JULIA = 2
+    DISTANCE = 3
+
+class KernelMode(Enum):
+    SERIAL = 0
+    PARALLEL = 1
+    OPTIMIZED = 2
+    MARIANI_SILVER = 3
+
+class ColourMode(Enum):
+    ITERATION = 0
+    SMOOTH = 1
+    HISTOGRAM = 2
+
+mandelbrot_kernels = {
+    KernelMode.SERIAL: mandelbrot,
+    KernelMode.PARALLEL: mandelbrot_parallel,
+    KernelMode.OPTIMIZED: mandelbrot_optimized,
+    KernelMode.MARIANI_SILVER: mandelbrot_subdivide,
+}
+
+julia_kernels = {
+    KernelMode.SERIAL: julia,
+    KernelMode.PARALLEL: julia_parallel,
+    KernelMode.OPTIMIZED: julia_optimized,
+    KernelMode.MARIANI_SILVER: julia_subdivide,
+}
+
+threaded_kernels = {mandelbrot_parallel, julia_parallel, mandelbrot_optimized, julia_optimized,
+                    mandelbrot_float32, julia_float32}
+
+# Calls a kernel from the tables above; the ones that deal columns out to
+# lanes get a lane for each thread numba runs now
+def run_kernel(kernel, *args):
+    if kernel in threaded_kernels:
+        return kernel(*args, get_num_threads())
+    return kernel(*args)
+
+# Runs render jobs on a background thread so the event loop never waits on a
+# kernel. Submitting a new job makes the running one stale; jobs poll
+# is_stale() between pieces of work and give up as soon as it returns True.
+# Jobs publish whole results, or with a tile ((x0, y0, x1, y1), done, total)
+# only the part of their buffer that tile covers. Tiles queue up until polled;
+# a whole result replaces any still queued.
+class ProgressiveRenderer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.job = None
+        self.generation = 0
+        self.result = None
+        self.tile_data = None
+        self.tiles = []
+        self.progress = None
+        self.running = True
+        # Launch numba's thread pool from the main thread: a pool first started
+        # from the worker keeps the process from exiting
+        get_num_threads()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        with self.wakeup:
+            self.generation += 1
+            self.job = (self.generation, job)
+            self.tiles = []
+            self.wakeup.notify()
+
+    # Interpreter shutdown can hang on a thread still inside a kernel, so the
+    # running job is made stale and the thread joined before exiting
+    def stop(self):
+        with self.wakeup:
+            self.generation += 1
+            self.running = False
+            self.wakeup.notify()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.wakeup:
+                while self.job is None and self.running:
+                    self.wakeup.wait()
+                if not self.running:
+                    return
+                generation, job = self.job
+                self.job = None
+
+            def is_stale():
+                return generation != self.generation
+
+            def publish(result, tile=None):
+                with self.lock:
+                    if generation != self.generation:
+                        return
+                    if tile is None:
+                        self.result = result
+                        self.tiles = []
+                    else:
+                        rect, done, total = tile
+                        self.tile_data = result
+                        self.tiles.append(rect)
+                        self.progress = (done, total)
+
+            job(is_stale, publish)
+
+    def poll(self):
+        with self.lock:
+            result, self.result = self.result, None
+        return result
+
+    # The buffer the queued tiles belong to, the tiles, and the progress of
+    # the last one
+    def poll_tiles(self):
+        with self.lock:
+            tiles, self.tiles = self.tiles, []
+            return self.tile_data, tiles, self.progress
+
+# The last finished iteration buffer and the view it was computed for, shared
+# between Fractals and the snapshots handed to the renderer thread.
+class LastFrame:
+    def __init__(self):
+        self.pixel_data = None
+        self.key = None
+        self.center = None
+        self.scale = None
+        self.stats = None
+
+    def store(self, key, center, scale, pixel_data, stats=None):
+        self.key = key
+        self.center = center
+        self.scale = scale
+        self.pixel_data = pixel_data
+        self.stats = stats
+
+# Iteration tiles keyed by (mode, C, maxIterations, scale, tile x, tile y).
+# Least recently used tiles are evicted once the cache goes over max_bytes.
+class TileCache:
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.tiles = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                self.tiles.move_to_end(key)
+            return tile
+
+    # Hits and misses are counted by the caller, once per tile it places
+    def record(self, hits, misses=0):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def put(self, key, tile):
+        with self.lock:
+            old = self.tiles.pop(key, None)
+            if old is not None:
+                self.bytes -= old.nbytes
+            self.tiles[key] = tile
+            self.bytes += tile.nbytes
+            while self.bytes > self.max_bytes and len(self.tiles) > 1:
+                _, evicted = self.tiles.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.bytes = 0
+
+    def __str__(self):
+        return f"{len(self.tiles)} tiles, {self.bytes / 2**20:.1f} MB, {self.hits} hits, {self.misses} misses"
+
+# Colours iteration counts straight into a persistent 32-bit surface. The
+# palette is scaled once per (max_value, palette) into a table of mapped
+# pixels, so a frame is a single gather into the surface, lut_colours(), with
+# no temporaries.
+class Colorizer:
+    def __init__(self, width, height):
+        self.surface = pygame.Surface((width, height), depth=32)
+        self.shifts = np.array(self.surface.get_shifts()[:3], dtype=np.uint32)
+        self.luts = {}
+        # Scaling of the last whole frame, for the tiles that follow it
+        self.frame_lut = None
+        self.max_value = None
+
+    def map_colors(self, colors):
+        return pygame.surfarray.map_array(self.surface, colors.reshape(-1, 1, 3)).reshape(-1).astype(np.uint32)
+
+    def lut(self, max_value, palette):
+        key = (max_value, id(palette))
+        entry = self.luts.get(key)
+        if entry is None or entry[0] is not palette:
+            mapped = self.map_colors(palette_lut(max_value, palette))
+            if len(self.luts) >= 64:
+                self.luts.clear()
+            entry = self.luts[key] = (palette, mapped)
+        return entry[1]
+
+    def histogram_lut(self, pixel_data, max_value, palette):
+        counts = histogram(pixel_data, max_value)
+        return self.map_colors(palette[histogram_index(counts, len(palette))])
+
+    # float32 data holds smooth iteration values, anything else plain counts.
+    # supersampled is the output of supersample() for the counts, if any.
+    def colour(self, pixel_data, palette, mode=ColourMode.ITERATION, supersampled=None):
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        if pixel_data.dtype == np.float32:
+            self.max_value = float(pixel_data.max())
+            smooth_colours(pixel_data, palette, self.max_value, self.shifts, pixels)
+        else:
+            max_value = int(pixel_data.max())
+            if mode == ColourMode.HISTOGRAM:
+                lut = self.histogram_lut(pixel_data, max_value, palette)
+            else:
+                lut = self.lut(max_value, palette)
+            self.frame_lut = lut
+            lut_colours(pixel_data, lut, pixels)
+            if supersampled is not None:
+                antialias_colours(*supersampled, lut, self.shifts, pixels)
+        del pixels
+        return self.surface
+
+    # Colours the rect (x0, y0, x1, y1) of a frame in progress with the scaling
+    # of the last whole frame, so it matches what is already on screen
+    def colour_tile(self, pixel_data, palette, rect):
+        x0, y0, x1, y1 = rect
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        if pixel_data.dtype == np.float32:
+            max_value = self.max_value if self.max_value is not None else float(pixel_data.max())
+            smooth_colours(pixel_data[x0:x1, y0:y1], palette, max_value, self.shifts, pixels[x0:x1, y0:y1])
+        else:
+            lut = self.frame_lut if self.frame_lut is not None else self.lut(int(pixel_data.max()), palette)
+            lut_colours(pixel_data[x0:x1, y0:y1], lut, pixels[x0:x1, y0:y1])
+        del pixels
+        return self.surface
+
+    # distance holds distances to the Mandelbrot set in pixels, all of them
+    # or those of rect
+    def distance(self, distance, palette, rect=None):
+        x0, y0, x1, y1 = rect if rect is not None else (0, 0) + distance.shape
+        pixels = pygame.surfarray.pixels2d(self.surface)
+        distance_colours(distance[x0:x1, y0:y1], palette, float(max(self.surface.get_size())),
+                         self.shifts, pixels[x0:x1, y0:y1])
+        del pixels
+        return self.surface
+
+# What one render did: wall time in each stage, and the points the kernels
+# computed with the time spent in them. Pixels taken from the last frame or
+# from cached tiles are not computed, so they are not counted. Distances come
+# without counts, so a render with any has no iteration total.
+class RenderWork:
+    stages = ("coarse", "final", "antialias")
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(self.stages, 0.0)
+        self.stage_start = time.perf_counter()
+        self.points = 0
+        self.iterations = 0
+        self.kernel_seconds = 0.0
+
+    def computed(self, counts, points, seconds):
+        self.points += points
+        self.kernel_seconds += seconds
+        if counts is None:
+            self.iterations = None
+        elif self.iterations is not None:
+            self.iterations += int(counts.sum(dtype=np.int64))
+
+    # Ends the current stage, which began where the last one ended
+    def stage(self, name):
+        now = time.perf_counter()
+        self.seconds[name] += now - self.stage_start
+        self.stage_start = now
+
+# Timings of the last size renders for the HUD. A render is recorded when its
+# final frame is computed, on whichever thread computed it. It then gets its
+# colouring time when that same frame is coloured, and its blit time the first
+# time it is put on screen; only then does it enter the ring buffer. Rates are
+# over the time spent in the kernels, and left blank when they computed
+# nothing, as for a frame made of cached tiles.
+class RenderTimings:
+    columns = ("time", "width", "height", "points", "iterations", "coarse_ms", "final_ms", "antialias_ms",
+               "colour_ms", "blit_ms", "megapixels_per_s", "iterations_per_s")
+
+    def __init__(self, size=256):
+        self.records = deque(maxlen=size)
+        self.rendered_frame = None
+        self.coloured_frame = None
+        self.hud = None
+
+    def rendered(self, result, work):
+        pixel_data = result[0] if isinstance(result, tuple) else result
+        record = {
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "width": pixel_data.shape[0],
+            "height": pixel_data.shape[1],
+            "points": work.points,
+            "iterations": work.iterations,
+            "megapixels_per_s": None,
+            "iterations_per_s": None,
+        }
+        for stage in work.stages:
+            record[f"{stage}_ms"] = work.seconds[stage] * 1000
+        if work.points:
+            seconds = max(work.kernel_seconds, 1e-9)
+            record["megapixels_per_s"] = work.points / seconds / 1e6
+            if work.iterations is not None:
+                record["iterations_per_s"] = work.iterations / seconds
+        self.rendered_frame = (result, record)
+
+    def coloured(self, result, seconds):
+        frame = self.rendered_frame
+        if frame is not None and frame[0] is result:
+            frame[1]["colour_ms"] = seconds * 1000
+            self.rendered_frame = None
+            self.coloured_frame = frame[1]
+
+    def blitted(self, seconds):
+        record = self.coloured_frame
+        if record is not None:
+            record["blit_ms"] = seconds * 1000
+            self.records.append(record)
+            self.coloured_frame = None
+            self.hud = None
+
+    # tile_cache, if given, gets a line of its own under the timings
+    def draw(self, screen, tile_cache=None):
+        if not self.records:
+            return
+        if self.hud is None:
+            last = self.records[-1]
+            stages = [f"{stage}_ms" for stage in RenderWork.stages] + ["colour_ms", "blit_ms"]
+            average = {key: sum(record[key] for record in self.records) / len(self.records) for key in stages}
+            lines = [f"{key[:-3]:<9} {last[key]:7.1f} ms   avg {average[key]:7.1f}" for key in stages]
+            rates = []
+            if last["megapixels_per_s"] is not None:
+                rates.append(f"{last['megapixels_per_s']:.1f} Mpixel/s")
+            if last["iterations_per_s"] is not None:
+                rates.append(f"{last['iterations_per_s'] / 1e6:.0f} Miter/s")
+            lines += ["   ".join(rates) or "nothing computed", f"{len(self.records)} renders"]
+            if tile_cache is not None:
+                lines.append(str(tile_cache))
+            font = pygame.font.SysFont("monospace", 14)
+            rows = [font.render(line, True, (255, 255, 255)) for line in lines]
+            self.hud = pygame.Surface((max(row.get_width() for row in rows) + 12,
+                                       sum(row.get_height() for row in rows) + 12), pygame.SRCALPHA)
+            self.hud.fill((0, 0, 0, 160))
+            y = 6
+            for row in rows:
+                self.hud.blit(row, (6, y))
+                y += row.get_height()
+        screen.blit(self.hud, (screen.get_width() - self.hud.get_width() - 8, 8))
+
+    def dump(self, filename):
+        with open(filename, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=self.columns)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+# Julia preview for the point under the mouse, computed on its own worker at
+# a lower iteration cap in coarse-to-fine passes. Finished previews are kept
+# for the most recent values of C, so hovering back over a point is instant.
+class JuliaPreview:
+    def __init__(self, size=256, max_iterations=256, cache_size=64):
+        self.size = size
+        self.max_iterations = max_iterations
+        self.refine_factors = (4, 2, 1)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.key = None
+        self.renderer = ProgressiveRenderer()
+
+    # Only a change of C (or of the iteration cap) starts a new preview
+    def request(self, C, itsMaxIter):
+        key = (C, min(itsMaxIter, self.max_iterations))
+        if key == self.key:
+            return
+        self.key = key
+        with self.lock:
+            pixel_data = self.cache.get(key)
+            if pixel_data is not None:
+                self.cache.move_to_end(key)
+        if pixel_data is not None:
+            self.renderer.submit(lambda is_stale, publish: publish(pixel_data))
+        else:
+            self.renderer.submit(lambda is_stale, publish: self.render(key, is_stale, publish))
+
+    def render(self, key, is_stale, publish):
+        C, itsMaxIter = key
+        scale = 4 / self.size
+        for factor in self.refine_factors:
+            if is_stale():
+                return
+            size = self.size // factor
+            pixel_data = julia_small(size, size, complex(-2, -2), C, scale * factor, scale * factor, itsMaxIter)
+            if factor > 1:
+                pixel_data = pixel_data.repeat(factor, axis=0).repeat(factor, axis=1)
+            publish(pixel_data)
+        with self.lock:
+            self.cache[key] = pixel_data
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def poll(self):
+        return self.renderer.poll()
+
+    def stop(self):
+        self.renderer.stop()
 
 class Fractals:
     def __init__(self, width, height):
@@ -59,13 +1199,15 @@ class Fractals:
         self.dragStart = (0, 0)
         self.corner1 = complex(-2.25, -1.5)
         self.corner2 = complex(0.75, 1.5)
-        self.center = complex(-0.75, 0.0)
+        self.set_center(complex(-0.75, 0.0))
 
         self.maxIterations = 1024
 
         self.scale = 3 / min(width, height)
 
         self.drawing_mode = DrawingMode.MANDELBROT
+        self.kernel_mode = KernelMode.OPTIMIZED
+        self.colour_mode = ColourMode.ITERATION
 
         self.julia_C = complex(0.285, 0.01)
 
@@ -73,6 +1215,60 @@ class Fractals:
         self.last_zoom_time = 0
         self.min_selection_size = 5
 
+        # Coarse-to-fine passes: 1/8 resolution first, then refine to full.
+        # The full pass streams in tile by tile, so it follows 1/4 directly.
+        self.progressive = True
+        self.refine_factors = (8, 4, 1)
+        self.band_width = 64
+        self.renderer = None
+
+        # The final pass streams tiles to the screen out from the middle of
+        # the view and from focus, the cursor position when the render
+        # started. progress is (done, total) tiles while they stream.
+        self.focus = None
+        self.progress = None
+
+        self.last_frame = LastFrame()
+        self.pan_step = 8
+
+        self.use_tiles = True
+        self.tile_size = 128
+        self.tile_cache = TileCache()
+
+        # Above this scale float32 is precise enough for all but a few
+        # chaotic pixels near the boundary
+        self.float32_threshold = 1e-4
+
+        # Below this scale float64 runs out of precision and pixels are
+        # computed by perturbation around a high-precision center instead
+        self.deep_zoom_threshold = 1e-12
+        self.reference = ReferenceOrbit()
+
+        # Auto iterations adjust maxIterations between renders
+        self.auto_iterations = False
+        self.iteration_range = (256, 32768)
+        self.near_cap = 0.001
+        self.frame_budget = 1.0
+        self.render_start = 0.0
+
+        # RenderTimings while the HUD is on, None otherwise, and the
+        # RenderWork of the render in progress while they are on
+        self.timings = None
+        self.work = None
+
+        # Samples per side on edge pixels of finished frames, 0 for none, the
+        # step in any colour channel, out of 255, that makes an edge, and the
+        # iterations the samples may take, relative to the frame's. A budget
+        # of 0.7 keeps anti-aliasing under 2x the cost of the frame.
+        self.antialias = 0
+        self.antialias_threshold = 16
+        self.antialias_budget = 0.7
+
+        # Surfaces are only created once something is drawn on screen
+        self.colorizer = None
+        self.preview_colorizer = None
+        self.preview = None
+
     def max_iterations(self):
         return self.maxIterations
     
@@ -84,12 +1280,30 @@ class Fractals:
         self.corner1 = complex(realMin, imagMin)
         self.corner2 = complex(realMax, imagMax)
 
+    # center_hp holds the center as Decimals, exact through any number of moves
+    def set_center(self, center):
+        self.center_hp = (Decimal(center.real), Decimal(center.imag))
+        self.center = center
+
+    # Center given as decimal strings, for views deeper than float64
+    def set_center_decimal(self, real, imag):
+        self.center_hp = (Decimal(real), Decimal(imag))
+        self.center = complex(float(self.center_hp[0]), float(self.center_hp[1]))
+
     def MoveCenter(self, offsetx, offsety):
         offsetReal = offsetx * self.scale
         offsetImag = offsety * self.scale
-        self.center = self.center + complex(offsetReal, offsetImag)
+        with localcontext() as ctx:
+            ctx.prec = max(30, 20 - int(math.log10(self.scale)))
+            self.center_hp = (self.center_hp[0] + Decimal(offsetReal),
+                              self.center_hp[1] + Decimal(offsetImag))
+        self.center = complex(float(self.center_hp[0]), float(self.center_hp[1]))
         self.UpdateCorners()
 
+    def Pan(self, dx, dy):
+        self.MoveCenter(dx * self.width // self.pan_step, dy * self.height // self.pan_step)
+        self.redraw()
+
     def ZoomIn(self, amount=2):
         self.scale /= amount
         self.UpdateCorners()
@@ -162,39 +1376,474 @@ class Fractals:
         self.mouse_pos = pygame.mouse.get_pos()
         self.julia_preview()
             
+    def deep_zoom(self):
+        return self.scale < self.deep_zoom_threshold
+
+    # Computes a width x height grid of points, point (i, j) being pixel
+    # (x0 + i * step, y0 + j * step) of the view
+    def compute(self, width, height, x0, y0, step):
+        if not self.deep_zoom():
+            corner = self.corner1 + complex(x0 * self.scale, y0 * self.scale)
+            return self.compute_at(width, height, corner, self.scale * step)
+        start = time.perf_counter()
+        julia_mode = self.drawing_mode == DrawingMode.JULIA
+        c = (Decimal(self.julia_C.real), Decimal(self.julia_C.imag)) if julia_mode else self.center_hp
+        orbit = self.reference.get(self.center_hp, c, julia_mode, self.maxIterations, self.scale)
+        dcorner = complex((x0 - self.width / 2) * self.scale, (y0 - self.height / 2) * self.scale)
+        if self.distance():
+            counts = None
+            pixels = perturbation_distance(width, height, orbit, dcorner, self.scale * step,
+                                           self.scale * step, self.maxIterations, self.scale, get_num_threads())
+        elif self.smooth():
+            pixels = np.empty((width, height), dtype=np.float32)
+            counts = perturbation(width, height, orbit, dcorner, julia_mode, self.scale * step,
+                                  self.scale * step, self.maxIterations, get_num_threads(), pixels)
+        else:
+            counts = pixels = perturbation(width, height, orbit, dcorner, julia_mode, self.scale * step,
+                                           self.scale * step, self.maxIterations, get_num_threads())
+        self.computed(counts, width * height, start)
+        return pixels
+
+    # Computes a grid of points from an absolute corner, in float64 or, at
+    # shallow zooms with the optimized kernel, float32
+    def compute_at(self, width, height, corner, scale):
+        start = time.perf_counter()
+        if self.distance():
+            counts = None
+            pixels = mandelbrot_distance(width, height, corner, scale, scale, self.maxIterations, self.scale,
+                                         get_num_threads())
+        elif self.smooth():
+            pixels = np.empty((width, height), dtype=np.float32)
+            if self.drawing_mode == DrawingMode.JULIA:
+                counts = julia_optimized(width, height, corner, self.julia_C,
+                                         scale, scale, self.maxIterations, get_num_threads(), pixels)
+            else:
+                counts = mandelbrot_optimized(width, height, corner, scale, scale, self.maxIterations,
+                                              get_num_threads(), pixels)
+        elif self.drawing_mode == DrawingMode.JULIA:
+            kernel = julia_kernels[self.kernel_mode]
+            if self.float32(scale):
+                kernel = julia_float32
+            counts = pixels = run_kernel(kernel, width, height, corner, self.julia_C,
+                                         scale, scale, self.maxIterations)
+        else:
+            kernel = mandelbrot_kernels[self.kernel_mode]
+            if self.float32(scale):
+                kernel = mandelbrot_float32
+            counts = pixels = run_kernel(kernel, width, height, corner, scale, scale, self.maxIterations)
+        self.computed(counts, width * height, start)
+        return pixels
+
+    # Adds points the kernels just computed to the render's work, when the
+    # timings are on. Distances come without counts.
+    def computed(self, counts, points, start):
+        if self.work is not None:
+            self.work.computed(counts, points, time.perf_counter() - start)
+
+    # The optimized kernel runs in float32 at shallow zooms
+    def float32(self, scale):
+        return self.kernel_mode == KernelMode.OPTIMIZED and scale > self.float32_threshold
+
     def mandelbrot_set(self):
         self.UpdateCorners()
-        return mandelbrot(self.width, self.height, self.corner1,
+        kernel = mandelbrot_kernels[self.kernel_mode]
+        if self.float32(self.scale):
+            kernel = mandelbrot_float32
+        return run_kernel(kernel, self.width, self.height, self.corner1,
                           self.scale, self.scale, self.maxIterations)
     
     def julia_set(self):
         self.UpdateCorners()
-        return julia(self.width, self.height, self.corner1, self.julia_C,
-                     self.scale, self.scale, self.maxIterations)
+        kernel = julia_kernels[self.kernel_mode]
+        if self.float32(self.scale):
+            kernel = julia_float32
+        return run_kernel(kernel, self.width, self.height, self.corner1, self.julia_C,
+                          self.scale, self.scale, self.maxIterations)
+
+    # Smooth colouring needs float32 smooth values from the kernels instead of
+    # counts; those buffers then flow through the same passes, tiles and frames
+    def smooth(self):
+        return self.colour_mode == ColourMode.SMOOTH
+
+    # The distance mode has one kernel whatever the kernel and colour modes,
+    # and its frames hold float32 distances in pixels instead of counts
+    def distance(self):
+        return self.drawing_mode == DrawingMode.DISTANCE
+
+    def pixel_dtype(self):
+        return np.float32 if self.smooth() or self.distance() else np.uint16
+
+    # The kernel behind frames of counts. Kernels disagree on a few pixels,
+    # so frames from one are not reused for another. Smooth colouring,
+    # distances and deep zooms each have a single kernel.
+    def kernel(self):
+        if self.smooth() or self.distance() or self.deep_zoom():
+            return None
+        return self.kernel_mode, self.float32(self.scale)
+
+    def frame_key(self):
+        return (self.drawing_mode, self.julia_C, self.maxIterations, self.smooth(), self.kernel())
+
+    def store_frame(self, pixel_data):
+        stats = None
+        if self.auto_iterations and not self.distance():
+            stats = escape_stats(pixel_data, self.maxIterations) + (time.perf_counter() - self.render_start,)
+        self.last_frame.store(self.frame_key(), self.center_hp, self.scale, pixel_data, stats)
 
+    # Auto iterations: doubles the cap while more than near_cap of the last
+    # frame escaped close to it and the frame took under half of frame_budget
+    # seconds. Once every escape ends below a quarter of the cap, the cap falls
+    # to the power of two above twice the highest escape.
+    def adapt_iterations(self):
+        frame = self.last_frame
+        if not self.auto_iterations or frame.stats is None or frame.key != self.frame_key():
+            return
+        never, near, highest, elapsed = frame.stats
+        pixels = frame.pixel_data.size
+        cap = self.maxIterations
+        if near > self.near_cap * pixels and elapsed < self.frame_budget / 2:
+            cap = min(cap * 2, self.iteration_range[1])
+        elif highest < cap / 4:
+            cap = max(1 << math.ceil(math.log2(max(2 * highest, 1))), self.iteration_range[0])
+        if cap != self.maxIterations:
+            print(f"Iterations: {cap} ({near} pixels near the cap, {never} never escaped, {elapsed * 1000:.0f} ms)")
+            self.maxIterations = cap
+
+    # Position of the last frame's corner in this view, in this view's pixels.
+    # The centers are subtracted as Decimals so this holds in deep zooms.
+    def frame_offset(self):
+        frame = self.last_frame
+        if frame.pixel_data is None or frame.key != self.frame_key():
+            return None
+        with localcontext() as ctx:
+            ctx.prec = max(30, 20 - int(math.log10(self.scale)))
+            dx = float(frame.center[0] - self.center_hp[0])
+            dy = float(frame.center[1] - self.center_hp[1])
+        shrink = 1 - frame.scale / self.scale
+        return (dx / self.scale + (self.width / 2) * shrink,
+                dy / self.scale + (self.height / 2) * shrink)
+
+    # A pure pan at the same scale: shift the last frame and compute only the
+    # strips it does not cover.
+    def pan_frame(self):
+        offset = self.frame_offset()
+        if offset is None or self.last_frame.scale != self.scale:
+            return None
+        dx, dy = round(offset[0]), round(offset[1])
+        if abs(offset[0] - dx) > 0.01 or abs(offset[1] - dy) > 0.01:
+            return None
+        if abs(dx) >= self.width or abs(dy) >= self.height:
+            return None
+
+        old = self.last_frame.pixel_data
+        pixel_data = np.empty((self.width, self.height), dtype=old.dtype)
+        pixel_data[max(dx, 0):self.width + min(dx, 0), max(dy, 0):self.height + min(dy, 0)] = \
+            old[max(-dx, 0):self.width + min(-dx, 0), max(-dy, 0):self.height + min(-dy, 0)]
+
+        # Exposed columns span the full height, exposed rows only the rest
+        left, right = (dx, self.width) if dx > 0 else (0, self.width + dx)
+        strips = [(0, 0, dx, self.height)] if dx > 0 else []
+        if dx < 0:
+            strips.append((self.width + dx, 0, -dx, self.height))
+        if dy > 0:
+            strips.append((left, 0, right - left, dy))
+        elif dy < 0:
+            strips.append((left, self.height + dy, right - left, -dy))
+        for x0, y0, width, height in strips:
+            pixel_data[x0:x0 + width, y0:y0 + height] = self.compute(width, height, x0, y0, 1)
+        return pixel_data
+
+    # After zooming in, a nearest-neighbour resample of the last frame covers
+    # the whole view. Returns it with the zoom factor, or None.
+    def zoom_preview(self):
+        index = self.resample_index()
+        if index is None:
+            return None
+        return self.last_frame.pixel_data[index], self.last_frame.scale / self.scale
+
+    # Last frame pixel nearest to each pixel of this view, as an np.ix_ index,
+    # or None if the view is not inside the last frame
+    def resample_index(self):
+        offset = self.frame_offset()
+        if offset is None:
+            return None
+        old = self.last_frame.pixel_data
+        ratio = self.scale / self.last_frame.scale
+        u = np.floor((np.arange(self.width) - offset[0]) * ratio + 0.5).astype(np.intp)
+        v = np.floor((np.arange(self.height) - offset[1]) * ratio + 0.5).astype(np.intp)
+        if u[0] < 0 or v[0] < 0 or u[-1] >= old.shape[0] or v[-1] >= old.shape[1]:
+            return None
+        return np.ix_(u, v)
+
+    # A zoom in from the last frame. Pixels that land inside a flat region of
+    # the last frame, where a pixel and its eight neighbours share one count,
+    # take that count; only the rest are computed. Like subdivision, this
+    # misses detail smaller than the last frame's pixels, so callers should
+    # compute a full frame every so often.
+    def zoom_frame(self):
+        if self.smooth() or self.distance() or self.deep_zoom():
+            return None
+        index = self.resample_index()
+        if index is None or self.scale > self.last_frame.scale:
+            return None
+        old = self.last_frame.pixel_data
+        width, height = old.shape
+        flat = np.zeros(old.shape, dtype=np.bool_)
+        flat[1:-1, 1:-1] = True
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                flat[1:-1, 1:-1] &= old[1 + dx:width - 1 + dx, 1 + dy:height - 1 + dy] == old[1:-1, 1:-1]
+        pixel_data = np.where(flat[index], old[index], UNSET).astype(np.uint16)
+        julia_mode = self.drawing_mode == DrawingMode.JULIA
+        unset = pixel_data == UNSET
+        start = time.perf_counter()
+        fill_unset(pixel_data, self.corner1, self.julia_C, julia_mode,
+                   self.scale, self.scale, self.maxIterations, get_num_threads())
+        self.computed(pixel_data[unset], np.count_nonzero(unset), start)
+        return pixel_data
+
+    # Fills pixel_data from tiles on a grid fixed in the complex plane, so any
+    # view at the same scale lines up with the tiles of earlier views. The view
+    # is snapped to the nearest whole pixel of that grid. Returns False if a
+    # tile was missing and compute is False, or if the render went stale. With
+    # publish, tiles go in stream order and each is published as it is filled.
+    # A probe with compute False only counts its hits once it succeeds, so the
+    # fill that follows a failed probe counts each tile once.
+    def fill_tiles(self, pixel_data, compute=True, is_stale=None, publish=None):
+        size = self.tile_size
+        ox = math.floor(self.corner1.real / self.scale + 0.5)
+        oy = math.floor(self.corner1.imag / self.scale + 0.5)
+        # frame_key() holds the kernel in effect, so a kernel switch misses
+        # every tile computed by another
+        key = self.frame_key() + (self.scale,)
+        tiles = [(tx, ty) for tx in range(ox // size, (ox + self.width - 1) // size + 1)
+                 for ty in range(oy // size, (oy + self.height - 1) // size + 1)]
+        if publish is not None:
+            tiles.sort(key=lambda t: self.stream_distance(t[0] * size - ox, t[1] * size - oy,
+                                                          t[0] * size - ox + size, t[1] * size - oy + size))
+        for i, (tx, ty) in enumerate(tiles):
+            if is_stale is not None and is_stale():
+                return False
+            tile = self.tile_cache.get(key + (tx, ty))
+            if tile is None:
+                if not compute:
+                    return False
+                corner = complex(tx * size * self.scale, ty * size * self.scale)
+                tile = self.compute_at(size, size, corner, self.scale)
+                self.tile_cache.put(key + (tx, ty), tile)
+                self.tile_cache.record(0, 1)
+            elif compute:
+                self.tile_cache.record(1)
+            x0 = max(tx * size, ox)
+            x1 = min(tx * size + size, ox + self.width)
+            y0 = max(ty * size, oy)
+            y1 = min(ty * size + size, oy + self.height)
+            pixel_data[x0 - ox:x1 - ox, y0 - oy:y1 - oy] = \
+                tile[x0 - tx * size:x1 - tx * size, y0 - ty * size:y1 - ty * size]
+            if publish is not None:
+                publish(pixel_data, ((x0 - ox, y0 - oy, x1 - ox, y1 - oy), i + 1, len(tiles)))
+        if not compute:
+            self.tile_cache.record(len(tiles))
+        return True
+
+    # The final pass without the tile cache: the view cut into tiles of its
+    # own, computed and published in stream order
+    def stream_tiles(self, pixel_data, is_stale, publish):
+        size = self.tile_size
+        tiles = [(x0, y0, min(x0 + size, self.width), min(y0 + size, self.height))
+                 for x0 in range(0, self.width, size) for y0 in range(0, self.height, size)]
+        tiles.sort(key=lambda rect: self.stream_distance(*rect))
+        for i, (x0, y0, x1, y1) in enumerate(tiles):
+            if is_stale():
+                return False
+            pixel_data[x0:x1, y0:y1] = self.compute(x1 - x0, y1 - y0, x0, y0, 1)
+            publish(pixel_data, ((x0, y0, x1, y1), i + 1, len(tiles)))
+        return True
+
+    # Stream order: distance of a tile from the middle of the view or from
+    # focus, whichever is nearer
+    def stream_distance(self, x0, y0, x1, y1):
+        x = (x0 + x1) / 2
+        y = (y0 + y1) / 2
+        distance = math.hypot(x - self.width / 2, y - self.height / 2)
+        if self.focus is not None:
+            distance = min(distance, math.hypot(x - self.focus[0], y - self.focus[1]))
+        return distance
+
+    # Tiles are placed in float64 coordinates, so deep zooms bypass the cache
+    def tiled(self):
+        return self.use_tiles and not self.deep_zoom()
+
+    def render_pixels(self):
+        self.UpdateCorners()
+        pixel_data = self.pan_frame()
+        if pixel_data is None and self.tiled():
+            pixel_data = np.empty((self.width, self.height), dtype=self.pixel_dtype())
+            self.fill_tiles(pixel_data)
+        elif pixel_data is None:
+            pixel_data = self.compute(self.width, self.height, 0, 0, 1)
+        self.store_frame(pixel_data)
+        return pixel_data
+
+    # The result of a render, recorded in the timings when they are on.
+    # Everything since the coarse passes counts as the final stage.
+    def finish_frame(self, pixel_data):
+        if self.work is not None:
+            self.work.stage("final")
+        result = self.antialiased(pixel_data)
+        if self.work is not None:
+            self.work.stage("antialias")
+            self.timings.rendered(result, self.work)
+        return result
+
+    # A finished frame, paired with supersampled edges when anti-aliasing.
+    # Smooth colouring and distances have no bands to alias and are left as
+    # they are.
+    def antialiased(self, pixel_data):
+        if not self.antialias or self.smooth() or self.distance():
+            return pixel_data
+        julia_mode = self.drawing_mode == DrawingMode.JULIA
+        if self.deep_zoom():
+            c = (Decimal(self.julia_C.real), Decimal(self.julia_C.imag)) if julia_mode else self.center_hp
+            orbit = self.reference.get(self.center_hp, c, julia_mode, self.maxIterations, self.scale)
+            corner = complex(-(self.width / 2) * self.scale, -(self.height / 2) * self.scale)
+        else:
+            orbit = np.zeros(0, dtype=np.complex128)
+            corner = self.corner1
+        lut = count_lut(pixel_data, palette, self.colour_mode)
+        return pixel_data, supersample(pixel_data, lut, corner, self.julia_C, julia_mode, orbit,
+                                       self.scale, self.scale, self.maxIterations,
+                                       self.antialias, self.antialias_threshold, self.antialias_budget,
+                                       get_num_threads())
+
+    # Runs on the renderer thread against a snapshot of the view. Each pass
+    # samples every factor-th pixel and fills the blocks in between, working
+    # through the image in column bands so a stale render stops quickly. The
+    # full-resolution pass goes tile by tile instead, each tile published as
+    # soon as it is done.
+    def refine(self, is_stale, publish):
+        pixel_data = self.pan_frame()
+        if pixel_data is not None:
+            self.store_frame(pixel_data)
+            publish(self.finish_frame(pixel_data))
+            return
+
+        # A view made entirely of cached tiles needs no refinement at all
+        if self.tiled():
+            pixel_data = np.empty((self.width, self.height), dtype=self.pixel_dtype())
+            if self.fill_tiles(pixel_data, compute=False):
+                self.store_frame(pixel_data)
+                publish(self.finish_frame(pixel_data))
+                return
+
+        # Passes coarser than the resampled last frame would only look worse
+        factors = self.refine_factors
+        preview = self.zoom_preview()
+        if preview is not None:
+            pixel_data, zoom = preview
+            factors = [factor for factor in factors if factor < zoom] or [1]
+            publish(pixel_data)
+        else:
+            pixel_data = np.zeros((self.width, self.height), dtype=self.pixel_dtype())
+
+        for factor in factors:
+            if factor == 1:
+                if self.work is not None:
+                    self.work.stage("coarse")
+                if self.tiled():
+                    streamed = self.fill_tiles(pixel_data, True, is_stale, publish)
+                else:
+                    streamed = self.stream_tiles(pixel_data, is_stale, publish)
+                if not streamed:
+                    return
+                continue
+            width = -(-self.width // factor)
+            height = -(-self.height // factor)
+            last_publish = time.perf_counter()
+            for x0 in range(0, width, self.band_width):
+                if is_stale():
+                    return
+                x1 = min(x0 + self.band_width, width)
+                block = self.compute(x1 - x0, height, x0 * factor, 0, factor)
+                if factor > 1:
+                    block = block.repeat(factor, axis=0).repeat(factor, axis=1)
+                left = x0 * factor
+                right = min(x1 * factor, self.width)
+                pixel_data[left:right, :] = block[:right - left, :self.height]
+                # Show partial passes on slow renders, once a full pass exists
+                if (preview is not None or factor != factors[0]) and time.perf_counter() - last_publish > 0.1:
+                    publish(pixel_data)
+                    last_publish = time.perf_counter()
+            if factor != factors[-1]:
+                publish(pixel_data)
+        self.store_frame(pixel_data)
+        if not is_stale():
+            publish(self.finish_frame(pixel_data))
+
+    def toggle_colour_mode(self):
+        modes = list(ColourMode)
+        self.colour_mode = modes[(modes.index(self.colour_mode) + 1) % len(modes)]
+        print(f"Colouring: {self.colour_mode.name}")
+        self.redraw()
+
+    def toggle_kernel(self):
+        modes = list(KernelMode)
+        self.kernel_mode = modes[(modes.index(self.kernel_mode) + 1) % len(modes)]
+        print(f"Kernel: {self.kernel_mode.name}")
+        self.redraw()
+
+    def toggle_auto_iterations(self):
+        self.auto_iterations = not self.auto_iterations
+        print(f"Auto iterations: {'on' if self.auto_iterations else 'off'}")
+        self.redraw()
+
+    def toggle_antialias(self):
+        self.antialias = 0 if self.antialias else 4
+        print(f"Anti-aliasing: {f'{self.antialias}x{self.antialias}' if self.antialias else 'off'}")
+        self.redraw()
+
+    # Asks for the preview of the C under the mouse; results arrive in update()
     def julia_preview(self):
-        width = 256
-        height = 256
-        scale = 4 / max(width, height)
+        if self.preview is None:
+            self.preview = JuliaPreview(256)
+            self.preview_colorizer = Colorizer(256, 256)
         mouse_pos = pygame.mouse.get_pos()
         real = self.corner1.real + (mouse_pos[0] / self.width) * (self.corner2.real - self.corner1.real)
         imag = self.corner1.imag + ((self.height - mouse_pos[1]) / self.height) * (self.corner2.imag - self.corner1.imag)
         C = complex(real, imag)
-        corner = complex(-2, -2)
-        return julia(width, height, corner, C, scale, scale, self.maxIterations)
+        self.preview.request(C, self.maxIterations)
     
+    # Compiles the kernels not used so far on the renderer thread, the one
+    # thread that launches parallel kernels from here on (see warm_up())
+    def warm_up(self):
+        if self.renderer is None:
+            self.renderer = ProgressiveRenderer()
+        self.renderer.submit(lambda is_stale, publish: warm_up())
+
     def redraw(self):
-        global palette, color_data, pygame_surface, preview_surface
-        if self.drawing_mode == DrawingMode.MANDELBROT:
-            pixel_data = self.mandelbrot_set()
+        global palette, pygame_surface, preview_surface
+        self.adapt_iterations()
+        self.render_start = time.perf_counter()
+        self.work = RenderWork() if self.timings is not None else None
+        if self.progressive and self.drawing_mode != DrawingMode.NONE:
+            if self.drawing_mode == DrawingMode.JULIA:
+                preview_surface = None
+            if self.renderer is None:
+                self.renderer = ProgressiveRenderer()
+            self.focus = pygame.mouse.get_pos() if pygame.mouse.get_focused() else None
+            self.progress = None
+            self.UpdateCorners()
+            self.renderer.submit(copy.copy(self).refine)
+            return
+        if self.drawing_mode in (DrawingMode.MANDELBROT, DrawingMode.DISTANCE):
+            pixel_data = self.render_pixels()
         elif self.drawing_mode == DrawingMode.JULIA:
-            pixel_data = self.julia_set()
+            pixel_data = self.render_pixels()
             preview_surface = None
         else:
             print("Drawing mode not set")
             return
-        color_data = apply_palette(pixel_data, palette)
-        pygame_surface = pygame.pixelcopy.make_surface(color_data)
+        pygame_surface = self.colour(self.finish_frame(pixel_data))
 
     # page 283 of Fractal Programming in C by Roger T. Stevens
     # iterations, real, imag
@@ -225,41 +1874,110 @@ class Fractals:
         self.drawing_mode = DrawingMode.JULIA
         #self.maxIterations = self.juliasets[n][0]
         self.scale = 3 / min(self.width, self.height)
-        self.center = complex(0, 0)
+        self.set_center(complex(0, 0))
         self.UpdateCorners()
 
         self.redraw()
 
+    # The Mandelbrot and distance modes draw the same plane and keep the view
     def set_mode(self, mode):
-        if self.drawing_mode == DrawingMode.MANDELBROT and mode == DrawingMode.JULIA:
+        plane = (DrawingMode.MANDELBROT, DrawingMode.DISTANCE)
+        if self.drawing_mode in plane and mode == DrawingMode.JULIA:
             mouse_pos = pygame.mouse.get_pos()
             real = self.corner1.real + (mouse_pos[0] / self.width) * (self.corner2.real - self.corner1.real)
             imag = self.corner1.imag + ((self.height - mouse_pos[1]) / self.height) * (self.corner2.imag - self.corner1.imag)
             self.julia_C = complex(real, imag)
             self.drawing_mode = mode
-            self.center = complex(0, 0)
+            self.set_center(complex(0, 0))
             self.UpdateCorners()
             scale = 3 / min(self.width, self.height)
             self.scale = scale
-        elif self.drawing_mode == DrawingMode.JULIA and mode == DrawingMode.MANDELBROT:
+        elif self.drawing_mode == DrawingMode.JULIA and mode in plane:
             self.drawing_mode = mode
-            self.center = complex(-0.75, 0.0)
+            self.set_center(complex(-0.75, 0.0))
             self.UpdateCorners()
             scale = 4 / max(self.width, self.height)
             self.scale = scale
+        elif self.drawing_mode in plane and mode in plane:
+            self.drawing_mode = mode
         self.redraw()
 
     def mode(self):
         return self.drawing_mode
     
     def update(self, screen):
-        global preview_surface, preview_enabled
+        global pygame_surface, preview_surface, preview_enabled
+        if self.renderer is not None:
+            result = self.renderer.poll()
+            if result is not None:
+                pygame_surface = self.colour(result)
+                self.progress = None
+            pixel_data, tiles, progress = self.renderer.poll_tiles()
+            for rect in tiles:
+                pygame_surface = self.colour_tile(pixel_data, rect)
+            if tiles:
+                self.progress = progress
         if self.mouseDown:
             self.mouse_down(screen)
         if preview_enabled:
-            julia_preview_pixel_data = self.julia_preview()
-            julia_preview_color_data = apply_palette(julia_preview_pixel_data, palette)
-            preview_surface = pygame.pixelcopy.make_surface(julia_preview_color_data)
+            self.julia_preview()
+            julia_preview_pixel_data = self.preview.poll()
+            if julia_preview_pixel_data is not None:
+                preview_surface = self.preview_colorizer.colour(julia_preview_pixel_data, palette)
+
+    # result is a frame's pixel_data, or pixel_data paired with its
+    # supersampled edges
+    def colour(self, result):
+        if self.colorizer is None:
+            self.colorizer = Colorizer(self.width, self.height)
+        start = time.perf_counter()
+        pixel_data, supersampled = result if isinstance(result, tuple) else (result, None)
+        if self.distance():
+            surface = self.colorizer.distance(pixel_data, palette)
+        else:
+            surface = self.colorizer.colour(pixel_data, palette, self.colour_mode, supersampled)
+        if self.timings is not None:
+            self.timings.coloured(result, time.perf_counter() - start)
+        return surface
+
+    # One streamed tile of the frame in progress
+    def colour_tile(self, pixel_data, rect):
+        if self.colorizer is None:
+            self.colorizer = Colorizer(self.width, self.height)
+        if self.distance():
+            return self.colorizer.distance(pixel_data, palette, rect)
+        return self.colorizer.colour_tile(pixel_data, palette, rect)
+
+    # Bar along the bottom of the screen while tiles stream in
+    def draw_progress(self, screen):
+        if self.progress is None:
+            return
+        done, total = self.progress
+        pygame.draw.rect(screen, (255, 255, 255), (0, self.height - 3, self.width * done // total, 3))
+
+    # Called by the main loop with the time it took to put a frame on screen
+    def blitted(self, seconds):
+        if self.timings is not None:
+            self.timings.blitted(seconds)
+
+    def toggle_timings(self):
+        self.timings = None if self.timings is not None else RenderTimings()
+        print(f"Timings: {'on' if self.timings is not None else 'off'}")
+
+    def dump_timings(self):
+        if self.timings is None:
+            return
+        if not os.path.exists("screenshots"):
+            os.makedirs("screenshots")
+        filename = f"screenshots/timings_{datetime.now().strftime('%Y%m%d%H%M%S')}.csv"
+        self.timings.dump(filename)
+        print(f"Timings written to {filename}")
+
+    def stop(self):
+        if self.renderer is not None:
+            self.renderer.stop()
+        if self.preview is not None:
+            self.preview.stop()
 
     def save_screen(self, screen):
         if not os.path.exists("screenshots"):
@@ -271,6 +1989,8 @@ class Fractals:
             filename = f"screenshots/man_{time_str}.png"
         elif self.drawing_mode == DrawingMode.JULIA:
             filename = f"screenshots/julia_{time_str}.png"
+        elif self.drawing_mode == DrawingMode.DISTANCE:
+            filename = f"screenshots/dist_{time_str}.png"
         pygame.image.save(screen, filename)
 
 def load_palette(filename):
@@ -281,20 +2001,35 @@ def load_palette(filename):
             palette.append((r, g, b))
     return np.array(palette, dtype=np.uint8)
 
-def apply_palette(pixel_data, palette):
-    # Find the maximum value in pixel_data
-    max_value = np.max(pixel_data)
-
+# Palette colour for every iteration count from 0 to max_value
+def palette_lut(max_value, palette):
     # Calculate the scaling factor
-    scaling_factor = (len(palette)-1) / max_value
+    scaling_factor = (len(palette)-1) / max(max_value, 1)
+
+    # Scale every possible value to match the size of the palette
+    return palette[(np.arange(max_value + 1) * scaling_factor).astype(int)]
 
-    # Scale the pixel_data values to match the size of the palette
-    scaled_pixel_data = (pixel_data * scaling_factor).astype(int)
+# Histogram equalization: each count gets the palette position of its rank
+# among the escaped pixels, so every colour covers a similar area. The
+# maximum count keeps the last palette entry.
+def histogram_index(counts, palette_size):
+    max_value = len(counts) - 1
+    cdf = np.cumsum(counts[:max_value])
+    index = np.full(max_value + 1, palette_size - 1, dtype=np.intp)
+    if max_value > 0:
+        index[:max_value] = cdf * (palette_size - 2) // max(int(cdf[-1]), 1)
+    return index
 
-    # Use the scaled values to index into the palette
-    color_data = palette[scaled_pixel_data]
+# The rgb colour of every count up to the highest in pixel_data, as
+# Colorizer.colour() shows them in mode
+def count_lut(pixel_data, palette, mode):
+    max_value = int(pixel_data.max())
+    if mode == ColourMode.HISTOGRAM:
+        return palette[histogram_index(histogram(pixel_data, max_value), len(palette))]
+    return palette_lut(max_value, palette)
 
-    return color_data
+def apply_palette(pixel_data, palette):
+    return palette_lut(int(np.max(pixel_data)), palette)[pixel_data]
 
 def create_palette(size):
     palette = np.zeros((size, 3), dtype=np.uint8)
@@ -321,8 +2056,59 @@ def create_gradient_palette(size, c1, c2):
     
     return palette
 
+# Compiles the kernels, or loads them from numba's cache, with the argument
+# types they get at run time. The parallel kernels must only ever be launched
+# from one thread at a time: numba's workqueue threading layer, its fallback
+# when neither TBB nor OpenMP is installed, aborts the process on concurrent
+# launches. main() therefore runs this on the renderer thread (see
+# Fractals.warm_up), once the first frame is up.
+def warm_up():
+    corner = complex(-2.0, -1.0)
+    C = complex(0.285, 0.01)
+    lanes = get_num_threads()
+    mandelbrot_float32(8, 8, corner, 0.1, 0.1, 16, lanes)
+    no_orbit = np.zeros(0, dtype=np.complex128)
+    smooth = np.empty((8, 8), dtype=np.float32)
+    pixel_data = mandelbrot_optimized(8, 8, corner, 0.1, 0.1, 16, lanes)
+    mandelbrot_optimized(8, 8, corner, 0.1, 0.1, 16, lanes, smooth)
+    julia_optimized(8, 8, corner, C, 0.1, 0.1, 16, lanes)
+    julia_optimized(8, 8, corner, C, 0.1, 0.1, 16, lanes, smooth)
+    julia_float32(8, 8, corner, C, 0.1, 0.1, 16, lanes)
+    julia_small(8, 8, corner, C, 0.1, 0.1, 16)
+    mandelbrot_subdivide(8, 8, corner, 0.1, 0.1, 16)
+    julia_subdivide(8, 8, corner, C, 0.1, 0.1, 16)
+    distance = mandelbrot_distance(8, 8, corner, 0.1, 0.1, 16, 0.1, lanes)
+    fill_unset(np.full((8, 8), UNSET, dtype=np.uint16), corner, C, False, 0.1, 0.1, 16, lanes)
+    escape_stats(pixel_data, 16)
+    escape_stats(smooth, 16)
+
+    lut = count_lut(pixel_data, create_palette(16), ColourMode.ITERATION)
+    center = (Decimal(-1), Decimal(0))
+    orbit = reference_orbit(center, center, False, 16, 30)
+    for julia_mode in (False, True):
+        perturbation(8, 8, orbit, corner, julia_mode, 0.1, 0.1, 16, lanes)
+        perturbation(8, 8, orbit, corner, julia_mode, 0.1, 0.1, 16, lanes, smooth)
+        supersample(pixel_data, lut, corner, C, julia_mode, orbit, 0.1, 0.1, 16, 4, 1, 1.0, lanes)
+        supersample(pixel_data, lut, corner, C, julia_mode, no_orbit, 0.1, 0.1, 16, 4, 1, 1.0, lanes)
+    perturbation_distance(8, 8, orbit, corner, 0.1, 0.1, 16, 0.1, lanes)
+
+    colorizer = Colorizer(8, 8)
+    colours = create_palette(16)
+    supersampled = supersample(pixel_data, lut, corner, C, False, no_orbit, 0.1, 0.1, 16, 4, 1, 1.0, lanes)
+    for mode in ColourMode:
+        colorizer.colour(pixel_data, colours, mode, supersampled)
+    colorizer.colour(smooth, colours, ColourMode.SMOOTH)
+    colorizer.colour_tile(smooth, colours, (0, 0, 4, 4))
+    colorizer.colour_tile(pixel_data, colours, (0, 0, 4, 4))
+    colorizer.distance(distance, colours)
+    colorizer.distance(distance, colours, (0, 0, 4, 4))
+
 def main():
-    global palette, color_data, pygame_surface, preview_surface, preview_enabled
+    global palette, pygame_surface, preview_surface, preview_enabled
+    started = time.perf_counter()
+    # Launch numba's thread pool here on the main thread (see ProgressiveRenderer)
+    get_num_threads()
+
     pygame.init()
     width, height = 1280, 720
     screen = pygame.display.set_mode((width, height))
@@ -330,18 +2116,20 @@ def main():
     clock = pygame.time.Clock()
 
     fractals = Fractals(width, height)
+    fractals.render_start = time.perf_counter()
     pixel_data = fractals.mandelbrot_set()
+    # Kept like any other frame, so the first pan shifts it
+    fractals.store_frame(pixel_data)
 
     #palette = load_palette('palette.txt')
-    size = fractals.max_iterations()
+    # Counts are scaled onto the palette, so it stays put when maxIterations changes
+    size = 1024
     palette = create_palette(size)
     #palette = create_gradient_palette(size, (0, 255, 0), (255, 0, 0))
     #palette = create_gradient_palette(size, (255,255,0), (0,0,255))
 
-    color_data = apply_palette(pixel_data, palette)
-
-    # Create a Pygame surface from the color data
-    pygame_surface = pygame.pixelcopy.make_surface(color_data)
+    # Colour the first frame into the persistent surface
+    pygame_surface = fractals.colour(pixel_data)
 
     running = True
     while running:
@@ -361,6 +2149,14 @@ def main():
                 elif event.key == pygame.K_KP_MINUS:
                     fractals.ZoomOut()
                     fractals.redraw()
+                elif event.key == pygame.K_LEFT:
+                    fractals.Pan(-1, 0)
+                elif event.key == pygame.K_RIGHT:
+                    fractals.Pan(1, 0)
+                elif event.key == pygame.K_UP:
+                    fractals.Pan(0, -1)
+                elif event.key == pygame.K_DOWN:
+                    fractals.Pan(0, 1)
                 elif event.key == pygame.K_s:
                     fractals.save_screen(screen)
                 elif event.key == pygame.K_j:
@@ -371,6 +2167,21 @@ def main():
                     fractals.set_mode(DrawingMode.MANDELBROT)
                     pygame.display.set_caption("Mandlebrot")
                     fractals.redraw()
+                elif event.key == pygame.K_b:
+                    fractals.set_mode(DrawingMode.DISTANCE)
+                    pygame.display.set_caption("Mandlebrot distance")
+                elif event.key == pygame.K_c:
+                    fractals.toggle_colour_mode()
+                elif event.key == pygame.K_k:
+                    fractals.toggle_kernel()
+                elif event.key == pygame.K_a:
+                    fractals.toggle_antialias()
+                elif event.key == pygame.K_i:
+                    fractals.toggle_auto_iterations()
+                elif event.key == pygame.K_h:
+                    fractals.toggle_timings()
+                elif event.key == pygame.K_d:
+                    fractals.dump_timings()
                 elif event.key == pygame.K_p:
                     preview_enabled = not preview_enabled
                     #fractals.redraw()
@@ -406,18 +2217,29 @@ def main():
         fractals.update(screen)
 
         # Draw the main fractal
+        blit_start = time.perf_counter()
         screen.blit(pygame_surface, (0, 0))
 
         # Draw the Julia set preview
-        if preview_enabled and (preview_surface is not None) and (fractals.mode() == DrawingMode.MANDELBROT):
+        if preview_enabled and (preview_surface is not None) and (fractals.mode() in (DrawingMode.MANDELBROT, DrawingMode.DISTANCE)):
                 screen.blit(preview_surface, (0, 0))
 
         # Draw the selection rectangle
         fractals.draw_selection_rectangle(screen)
+        fractals.draw_progress(screen)
+
+        if fractals.timings is not None:
+            fractals.timings.draw(screen, fractals.tile_cache if fractals.tiled() else None)
 
         pygame.display.flip()
+        fractals.blitted(time.perf_counter() - blit_start)
+        if started is not None:
+            print(f"First frame after {time.perf_counter() - started:.2f} s")
+            started = None
+            fractals.warm_up()
         clock.tick(60)
 
+    fractals.stop()
     pygame.quit()
 
 if __name__ == "__main__":
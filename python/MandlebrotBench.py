@@ -0,0 +1,388 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+import numba
+import pygame
+from Mandlebrot import (mandelbrot, julia, mandelbrot_parallel, julia_parallel,
+                        mandelbrot_optimized, julia_optimized, mandelbrot_float32, julia_float32,
+                        mandelbrot_subdivide, julia_subdivide, supersample, count_lut, apply_palette,
+                        Colorizer, ColourMode, KernelMode, Fractals, RenderWork, create_palette, run_kernel)
+
+WIDTH, HEIGHT = 1280, 720
+MAX_ITER = 1024
+
+def default_view(width, height):
+    scale = 3 / min(width, height)
+    corner1 = complex(-0.75 - (width / 2) * scale, -(height / 2) * scale)
+    return corner1, scale
+
+def view_at(center, scale):
+    corner1 = center - complex((WIDTH / 2) * scale, (HEIGHT / 2) * scale)
+    return corner1, scale
+
+def best_time(fn, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def check_parallel():
+    corner1, scale = default_view(WIDTH, HEIGHT)
+    C = complex(0.285, 0.01)
+    serial = mandelbrot(WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+    parallel = run_kernel(mandelbrot_parallel, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+    assert np.array_equal(serial, parallel), "mandelbrot_parallel differs from mandelbrot"
+    serial = julia(WIDTH, HEIGHT, corner1, C, scale, scale, MAX_ITER)
+    parallel = run_kernel(julia_parallel, WIDTH, HEIGHT, corner1, C, scale, scale, MAX_ITER)
+    assert np.array_equal(serial, parallel), "julia_parallel differs from julia"
+    print("parallel kernels match the serial kernels pixel for pixel")
+
+def check_optimized():
+    corner1, scale = default_view(WIDTH, HEIGHT)
+    C = complex(0.285, 0.01)
+    serial = mandelbrot(WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+    optimized = run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+    assert np.array_equal(serial, optimized), "mandelbrot_optimized changes iteration counts"
+    serial = julia(WIDTH, HEIGHT, corner1, C, scale, scale, MAX_ITER)
+    optimized = run_kernel(julia_optimized, WIDTH, HEIGHT, corner1, C, scale, scale, MAX_ITER)
+    assert np.array_equal(serial, optimized), "julia_optimized changes iteration counts"
+    print("optimized kernels give identical iteration counts on the default view")
+
+def bench_optimized():
+    corner1, scale = default_view(WIDTH, HEIGHT)
+    parallel = best_time(lambda: run_kernel(mandelbrot_parallel, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+    optimized = best_time(lambda: run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+    print(f"optimized         {optimized * 1000:8.1f} ms   vs parallel {parallel / optimized:5.2f}x")
+
+# float32 counts drift on chaotic pixels near the boundary, so the check is
+# the share of pixels that differ from the float64 kernel
+def bench_float32():
+    views = {
+        "default": default_view(WIDTH, HEIGHT),
+        "seahorse valley": view_at(complex(-0.7436438870, 0.1318259042), 1e-4),
+    }
+    for name, (corner1, scale) in views.items():
+        expected = run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+        actual = run_kernel(mandelbrot_float32, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+        mismatched = np.count_nonzero(expected != actual) / expected.size
+        optimized = best_time(lambda: run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+        lockstep = best_time(lambda: run_kernel(mandelbrot_float32, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+        print(f"float32           {lockstep * 1000:8.1f} ms   vs optimized {optimized / lockstep:5.2f}x"
+              f"   {mismatched:.3%} pixels differ   ({name})")
+
+# Subdivision fills rectangles it never computes inside, so it is measured by
+# the share of pixels that differ from the brute-force kernel.
+def check_mariani_silver():
+    views = {
+        "default": default_view(WIDTH, HEIGHT),
+        "mini-brot": view_at(complex(-1.7687788, 0), 0.0002 / WIDTH),
+        "period-3 bulb": view_at(complex(-0.12, 0.75), 0.3 / WIDTH),
+    }
+    for name, (corner1, scale) in views.items():
+        brute = run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+        subdivided = mandelbrot_subdivide(WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+        mismatched = np.count_nonzero(brute != subdivided) / brute.size
+        brute_time = best_time(lambda: run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+        subdivided_time = best_time(lambda: mandelbrot_subdivide(WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+        print(f"mariani-silver    {subdivided_time * 1000:8.1f} ms   vs optimized {brute_time / subdivided_time:5.2f}x"
+              f"   {mismatched:.5%} pixels differ   ({name})")
+
+# Frames and tiles are only reused by the kernel that computed them: a
+# render computes nothing only if the same kernel has rendered that view
+# before, and always matches a render with nothing to reuse
+def check_kernel_keys():
+    fractals = Fractals(WIDTH // 4, HEIGHT // 4)
+    fractals.maxIterations = MAX_ITER
+    scales = (fractals.scale, fractals.float32_threshold / 2)
+    for use_tiles in (False, True):
+        fractals.use_tiles = use_tiles
+        seen = set()
+        for mode in (*KernelMode, KernelMode.OPTIMIZED):
+            for scale in scales:
+                fractals.kernel_mode = mode
+                fractals.scale = scale
+                fractals.work = RenderWork()
+                pixel_data = fractals.render_pixels()
+                reused = fractals.work.points == 0
+                assert reused == (use_tiles and (mode, scale) in seen), \
+                    f"{mode.name} at scale {scale:.2g}{' with tiles' if use_tiles else ''} " \
+                    f"{'reused a frame' if reused else 'was computed again'}"
+                seen.add((mode, scale))
+                fresh = Fractals(fractals.width, fractals.height)
+                fresh.maxIterations = MAX_ITER
+                fresh.use_tiles = use_tiles
+                fresh.kernel_mode = mode
+                fresh.scale = scale
+                expected = fresh.render_pixels()
+                assert np.array_equal(pixel_data, expected), f"{mode.name} frame is not its kernel's"
+    print("frames and tiles are only reused by the kernel that computed them")
+
+# apply_palette() and make_surface() as they were before the Colorizer
+def apply_palette_reference(pixel_data, palette):
+    max_value = np.max(pixel_data)
+    scaling_factor = (len(palette)-1) / max_value
+    scaled_pixel_data = (pixel_data * scaling_factor).astype(int)
+    return pygame.pixelcopy.make_surface(palette[scaled_pixel_data])
+
+def bench_palette():
+    corner1, scale = default_view(WIDTH, HEIGHT)
+    pixel_data = run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+    palette = create_palette(MAX_ITER)
+    colorizer = Colorizer(WIDTH, HEIGHT)
+    expected = pygame.surfarray.array3d(apply_palette_reference(pixel_data, palette))
+    actual = pygame.surfarray.array3d(colorizer.colour(pixel_data, palette))
+    assert np.array_equal(expected, actual), "Colorizer colours differ from apply_palette"
+
+    reference = best_time(lambda: apply_palette_reference(pixel_data, palette), 10)
+    lut = best_time(lambda: colorizer.colour(pixel_data, palette), 10)
+    print(f"palette           {lut * 1000:8.1f} ms   vs apply_palette + make_surface {reference / lut:5.2f}x")
+
+def bench_colouring(width=1920, height=1080):
+    scale = 3 / min(width, height)
+    corner1 = complex(-0.75 - (width / 2) * scale, -(height / 2) * scale)
+    smooth = np.empty((width, height), dtype=np.float32)
+    pixel_data = mandelbrot_optimized(width, height, corner1, scale, scale, MAX_ITER, numba.get_num_threads(), smooth)
+    palette = create_palette(MAX_ITER)
+    colorizer = Colorizer(width, height)
+    for mode, data in ((ColourMode.ITERATION, pixel_data), (ColourMode.SMOOTH, smooth),
+                       (ColourMode.HISTOGRAM, pixel_data)):
+        colorizer.colour(data, palette, mode)
+        elapsed = best_time(lambda: colorizer.colour(data, palette, mode), 10)
+        print(f"colour {mode.name.lower():<10} {elapsed * 1000:8.1f} ms   at {width}x{height}")
+
+# Adaptive 4x4 anti-aliasing against brute-force 4x4 supersampling, by mean
+# colour error per channel
+def bench_antialias():
+    views = {
+        "default": default_view(WIDTH, HEIGHT),
+        "seahorse valley": view_at(complex(-0.7436438870, 0.1318259042), 1e-5),
+    }
+    palette = create_palette(MAX_ITER)
+    colorizer = Colorizer(WIDTH, HEIGHT)
+    no_orbit = np.zeros(0, dtype=np.complex128)
+    fractals = Fractals(WIDTH, HEIGHT)
+    threshold, budget = fractals.antialias_threshold, fractals.antialias_budget
+    for name, (corner1, scale) in views.items():
+        pixel_data = run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER)
+        lut = count_lut(pixel_data, palette, ColourMode.ITERATION)
+        lanes = numba.get_num_threads()
+        supersampled = supersample(pixel_data, lut, corner1, 0j, False, no_orbit,
+                                   scale, scale, MAX_ITER, 4, threshold, budget, lanes)
+        plain = best_time(lambda: run_kernel(mandelbrot_optimized, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+        extra = best_time(lambda: supersample(pixel_data, lut, corner1, 0j, False, no_orbit,
+                                              scale, scale, MAX_ITER, 4, threshold, budget, lanes))
+
+        sub = scale / 4
+        big = run_kernel(mandelbrot_optimized, WIDTH * 4, HEIGHT * 4, corner1 - complex(2 * sub, 2 * sub),
+                         sub, sub, MAX_ITER)
+        reference = lut[np.minimum(big, len(lut) - 1)].reshape(WIDTH, 4, HEIGHT, 4, 3).mean(axis=(1, 3))
+        aliased = pygame.surfarray.array3d(colorizer.colour(pixel_data, palette))
+        antialiased = pygame.surfarray.array3d(colorizer.colour(pixel_data, palette, ColourMode.ITERATION, supersampled))
+        print(f"antialias 4x4     {(plain + extra) / plain:5.2f}x frame   {len(supersampled[0]) / pixel_data.size:6.1%} sampled"
+              f"   error {np.abs(aliased - reference).mean():5.2f} -> {np.abs(antialiased - reference).mean():5.2f}   ({name})")
+
+# Time to first frame of a fresh process, as main() gets there, first with an
+# empty numba cache and then with the cache it left behind
+FIRST_FRAME = '''
+import time
+started = time.perf_counter()
+import pygame, Mandlebrot
+pygame.init()
+screen = pygame.display.set_mode((1280, 720))
+fractals = Mandlebrot.Fractals(1280, 720)
+pixel_data = fractals.mandelbrot_set()
+Mandlebrot.palette = Mandlebrot.create_palette(1024)
+screen.blit(fractals.colour(pixel_data), (0, 0))
+pygame.display.flip()
+print(time.perf_counter() - started)
+'''
+
+def bench_startup():
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache, SDL_VIDEODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+        for run in ("empty cache", "cached"):
+            result = subprocess.run([sys.executable, "-c", FIRST_FRAME], env=env, capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+            print(f"first frame       {float(result.stdout) * 1000:8.1f} ms   ({run})")
+
+def bench_scaling():
+    corner1, scale = default_view(WIDTH, HEIGHT)
+    serial = best_time(lambda: mandelbrot(WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+    print(f"serial            {serial * 1000:8.1f} ms")
+
+    max_threads = numba.config.NUMBA_NUM_THREADS
+    for threads in range(1, max_threads + 1):
+        numba.set_num_threads(threads)
+        elapsed = best_time(lambda: run_kernel(mandelbrot_parallel, WIDTH, HEIGHT, corner1, scale, scale, MAX_ITER))
+        print(f"parallel x{threads:<3}     {elapsed * 1000:8.1f} ms   speedup {serial / elapsed:5.2f}")
+    numba.set_num_threads(max_threads)
+
+# The suite: every kernel on a fixed set of views, at several resolutions and
+# iteration caps. A view is a center and the span of the shorter side, so it
+# frames the same region at any resolution. Each configuration is run once to
+# compile and warm up, then timed repeats times; results go to JSON together
+# with what is needed to tell whether two runs are comparable.
+SUITE_VIEWS = {
+    "default": ("mandelbrot", complex(-0.75, 0), 3.0, None),
+    "seahorse valley": ("mandelbrot", complex(-0.743643887037151, 0.13182590420533), 1e-3, None),
+    "deep mini-brot": ("mandelbrot", complex(-0.7436423016578859, 0.13182651981259472), 5e-6, None),
+    "cardioid interior": ("mandelbrot", complex(-0.2, 0), 0.5, None),
+    "period-3 bulb": ("mandelbrot", complex(-0.122, 0.745), 0.1, None),
+}
+for i, (_, real, imag) in enumerate(Fractals.juliasets):
+    SUITE_VIEWS[f"julia {chr(ord('A') + i)}"] = ("julia", 0j, 3.0, complex(real, imag))
+
+SUITE_KERNELS = {
+    "serial": (mandelbrot, julia),
+    "parallel": (mandelbrot_parallel, julia_parallel),
+    "optimized": (mandelbrot_optimized, julia_optimized),
+    "float32": (mandelbrot_float32, julia_float32),
+    "mariani_silver": (mandelbrot_subdivide, julia_subdivide),
+}
+
+# Colouring stages, timed on the optimized kernel's counts for each view
+SUITE_COLOURING = ("apply_palette", "colour_iteration", "colour_histogram")
+
+def suite_call(kernel, view, width, height, iterations):
+    mode, center, span, C = SUITE_VIEWS[view]
+    scale = span / min(width, height)
+    corner1 = center - complex((width / 2) * scale, (height / 2) * scale)
+    mandelbrot_kernel, julia_kernel = SUITE_KERNELS[kernel]
+    if mode == "julia":
+        return lambda: run_kernel(julia_kernel, width, height, corner1, C, scale, scale, iterations)
+    return lambda: run_kernel(mandelbrot_kernel, width, height, corner1, scale, scale, iterations)
+
+def colouring_call(stage, pixel_data, palette, colorizer):
+    if stage == "apply_palette":
+        return lambda: pygame.surfarray.make_surface(apply_palette(pixel_data, palette))
+    mode = ColourMode.HISTOGRAM if stage == "colour_histogram" else ColourMode.ITERATION
+    return lambda: colorizer.colour(pixel_data, palette, mode)
+
+def measure(fn, repeats):
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def result(name, view, width, height, iterations, samples):
+    median = float(np.median(samples))
+    return {
+        "kernel": name,
+        "view": view,
+        "width": width,
+        "height": height,
+        "iterations": iterations,
+        "median_ms": median * 1000,
+        "p95_ms": float(np.percentile(samples, 95)) * 1000,
+        "pixels_per_s": width * height / median,
+        "samples_ms": [sample * 1000 for sample in samples],
+    }
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numba": numba.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "threads": numba.get_num_threads(),
+        "threading_layer": numba.config.THREADING_LAYER,
+    }
+
+def run_suite(kernels, views, sizes, caps, repeats):
+    results = []
+    for width, height in sizes:
+        colorizer = Colorizer(width, height)
+        for iterations in caps:
+            palette = create_palette(iterations)
+            for view in views:
+                for kernel in kernels:
+                    samples = measure(suite_call(kernel, view, width, height, iterations), repeats)
+                    results.append(result(kernel, view, width, height, iterations, samples))
+                    print(f"{kernel:<16} {view:<18} {width}x{height} {iterations:>6}   "
+                          f"median {results[-1]['median_ms']:9.2f} ms   p95 {results[-1]['p95_ms']:9.2f} ms",
+                          file=sys.stderr)
+                pixel_data = suite_call("optimized", view, width, height, iterations)()
+                for stage in SUITE_COLOURING:
+                    samples = measure(colouring_call(stage, pixel_data, palette, colorizer), repeats)
+                    results.append(result(stage, view, width, height, iterations, samples))
+    return results
+
+# Ratio of medians for every configuration the two runs share. Runs only
+# compare like for like when the environment matches, so differences in it
+# are printed first.
+def compare(baseline, current):
+    for key, value in baseline["environment"].items():
+        if key not in ("date", "commit") and current["environment"].get(key) != value:
+            print(f"environment differs: {key} {value} -> {current['environment'].get(key)}")
+    def key(entry):
+        return (entry["kernel"], entry["view"], entry["width"], entry["height"], entry["iterations"])
+    before = {key(entry): entry for entry in baseline["results"]}
+    for entry in current["results"]:
+        old = before.get(key(entry))
+        if old is not None:
+            print(f"{entry['kernel']:<16} {entry['view']:<18} {entry['width']}x{entry['height']} {entry['iterations']:>6}"
+                  f"   {old['median_ms']:9.2f} -> {entry['median_ms']:9.2f} ms   {old['median_ms'] / entry['median_ms']:5.2f}x")
+
+def parse_size(text):
+    width, height = (int(v) for v in text.lower().split("x"))
+    return width, height
+
+def main():
+    parser = argparse.ArgumentParser(description="Fractal kernel checks and benchmarks.")
+    parser.add_argument("--suite", metavar="JSON", help="run the benchmark suite and write its results here")
+    parser.add_argument("--kernels", nargs="+", choices=list(SUITE_KERNELS),
+                        default=["parallel", "optimized", "float32", "mariani_silver"])
+    parser.add_argument("--views", nargs="+", choices=list(SUITE_VIEWS), default=list(SUITE_VIEWS), metavar="VIEW")
+    parser.add_argument("--sizes", nargs="+", type=parse_size, default=[(640, 360), (1280, 720)])
+    parser.add_argument("--iterations", nargs="+", type=int, default=[256, 1024])
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="compare two suite results")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as baseline, open(args.compare[1]) as current:
+            compare(json.load(baseline), json.load(current))
+    elif args.suite:
+        results = run_suite(args.kernels, args.views, args.sizes, args.iterations, args.repeats)
+        with open(args.suite, "w") as file:
+            json.dump({"environment": environment(), "repeats": args.repeats, "results": results}, file, indent=1)
+    else:
+        checks()
+
+def checks():
+    bench_startup()
+    # Compile every kernel first so the timings leave out the JIT
+    check_parallel()
+    check_optimized()
+    bench_scaling()
+    bench_optimized()
+    bench_float32()
+    check_mariani_silver()
+    check_kernel_keys()
+    bench_palette()
+    bench_colouring()
+    bench_antialias()
+
+if __name__ == "__main__":
+    main()
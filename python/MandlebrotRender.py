@@ -0,0 +1,191 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import math
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import numba
+
+from Mandlebrot import (Fractals, DrawingMode, KernelMode, histogram, histogram_index,
+                        palette_lut, create_palette, load_palette)
+
+MAX_SIZE = 16384
+
+# Headless renderer for stills too big for the window. The iteration counts
+# are computed tile by tile into a memory-mapped file by a pool of worker
+# processes, then coloured and encoded band by band, so peak memory stays at a
+# few tiles per worker whatever the output size.
+
+worker = None
+
+def start_worker(view):
+    global worker
+    # Parallelism comes from the processes; one numba thread each
+    numba.set_num_threads(1)
+    worker = make_fractals(view)
+
+def make_fractals(view):
+    fractals = Fractals(view["width"], view["height"])
+    fractals.use_tiles = False
+    # Offline renders are never in float32: its counts drift near the boundary
+    fractals.float32_threshold = math.inf
+    fractals.drawing_mode = DrawingMode[view["mode"].upper()]
+    fractals.kernel_mode = KernelMode[view["kernel"].upper()]
+    fractals.julia_C = complex(view["c"][0], view["c"][1])
+    fractals.maxIterations = view["iterations"]
+    fractals.scale = view["scale"]
+    fractals.set_center_decimal(view["center"][0], view["center"][1])
+    fractals.UpdateCorners()
+    return fractals
+
+def render_tile(counts_path, x0, y0, width, height):
+    tile = worker.compute(width, height, x0, y0, 1)
+    counts = np.memmap(counts_path, dtype=np.uint16, mode="r+",
+                       shape=(worker.height, worker.width))
+    counts[y0:y0 + height, x0:x0 + width] = tile.T
+    counts.flush()
+    return histogram(tile, worker.maxIterations)
+
+def colour_rows(counts_path, shape, lut, y0, y1):
+    counts = np.memmap(counts_path, dtype=np.uint16, mode="r", shape=shape)
+    return lut[counts[y0:y1]]
+
+# Each band is compressed as its own raw deflate stream ending on a sync
+# flush, so the bands can be concatenated into one zlib stream. The adler32
+# checksums are combined afterwards.
+def compress_rows(counts_path, shape, lut, y0, y1, level, last):
+    rgb = colour_rows(counts_path, shape, lut, y0, y1)
+    raw = np.zeros((y1 - y0, shape[1] * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgb.reshape(y1 - y0, -1)
+    raw = raw.tobytes()
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = compressor.compress(raw) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+    return data, zlib.adler32(raw), len(raw)
+
+def write_raw_rows(counts_path, output, shape, lut, y0, y1):
+    rgb = np.memmap(output, dtype=np.uint8, mode="r+", shape=shape + (3,))
+    rgb[y0:y1] = colour_rows(counts_path, shape, lut, y0, y1)
+    rgb.flush()
+
+def adler32_combine(adler1, adler2, length2):
+    base = 65521
+    remainder = length2 % base
+    sum1 = adler1 & 0xffff
+    sum2 = (remainder * sum1) % base
+    sum1 = (sum1 + (adler2 & 0xffff) + base - 1) % base
+    sum2 = (sum2 + (adler1 >> 16) + (adler2 >> 16) + base - remainder) % base
+    return sum1 | (sum2 << 16)
+
+def png_chunk(kind, data):
+    chunk = kind + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+# Keeps at most window bands in flight so finished bands never pile up
+def ordered_results(executor, fn, jobs, window):
+    pending = []
+    for job in jobs:
+        pending.append(executor.submit(fn, *job))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+def write_png(executor, counts_path, output, shape, lut, band, level, workers):
+    height, width = shape
+    jobs = [(counts_path, shape, lut, y0, min(y0 + band, height), level, y0 + band >= height)
+            for y0 in range(0, height, band)]
+    with open(output, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        file.write(png_chunk(b"IDAT", b"\x78\x01"))
+        adler = 1
+        for data, band_adler, length in ordered_results(executor, compress_rows, jobs, 2 * workers):
+            file.write(png_chunk(b"IDAT", data))
+            adler = adler32_combine(adler, band_adler, length)
+        file.write(png_chunk(b"IDAT", struct.pack(">I", adler)))
+        file.write(png_chunk(b"IEND", b""))
+
+def write_raw(executor, counts_path, output, shape, lut, band):
+    np.memmap(output, dtype=np.uint8, mode="w+", shape=shape + (3,)).flush()
+    jobs = [executor.submit(write_raw_rows, counts_path, output, shape, lut, y0, min(y0 + band, shape[0]))
+            for y0 in range(0, shape[0], band)]
+    for job in jobs:
+        job.result()
+
+def render(view, output, palette, colouring="iteration", workers=None, tile=512, band=64, level=6):
+    workers = workers or os.cpu_count()
+    shape = (view["height"], view["width"])
+    directory = os.path.dirname(os.path.abspath(output))
+    handle, counts_path = tempfile.mkstemp(suffix=".counts", dir=directory)
+    os.close(handle)
+    try:
+        np.memmap(counts_path, dtype=np.uint16, mode="w+", shape=shape).flush()
+        with ProcessPoolExecutor(workers, initializer=start_worker, initargs=(view,)) as executor:
+            start = time.perf_counter()
+            jobs = [executor.submit(render_tile, counts_path, x0, y0,
+                                    min(tile, view["width"] - x0), min(tile, view["height"] - y0))
+                    for y0 in range(0, view["height"], tile)
+                    for x0 in range(0, view["width"], tile)]
+            counts = sum(job.result() for job in jobs)
+            print(f"computed {len(jobs)} tiles in {time.perf_counter() - start:.1f} s")
+
+            start = time.perf_counter()
+            max_value = int(np.flatnonzero(counts)[-1])
+            if colouring == "histogram":
+                lut = palette[histogram_index(counts[:max_value + 1], len(palette))]
+            else:
+                lut = palette_lut(max_value, palette)
+            if output.lower().endswith(".png"):
+                write_png(executor, counts_path, output, shape, lut, band, level, workers)
+            else:
+                write_raw(executor, counts_path, output, shape, lut, band)
+            print(f"wrote {output} in {time.perf_counter() - start:.1f} s")
+    finally:
+        os.remove(counts_path)
+
+def parse_size(text):
+    width, height = (int(v) for v in text.lower().split("x"))
+    if not (0 < width <= MAX_SIZE and 0 < height <= MAX_SIZE):
+        raise argparse.ArgumentTypeError(f"size must be between 1x1 and {MAX_SIZE}x{MAX_SIZE}")
+    return width, height
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a Mandelbrot or Julia still without a display.")
+    parser.add_argument("output", help="output file, .png or raw RGB for any other extension")
+    parser.add_argument("--size", type=parse_size, default=(3840, 2160), help="WIDTHxHEIGHT, up to 16384x16384")
+    parser.add_argument("--center", nargs=2, default=("-0.75", "0"), metavar=("REAL", "IMAG"),
+                        help="view center, as decimals of any precision")
+    parser.add_argument("--scale", type=float, help="size of one pixel in the complex plane")
+    parser.add_argument("--mode", choices=("mandelbrot", "julia"), default="mandelbrot")
+    parser.add_argument("--c", nargs=2, type=float, default=(0.285, 0.01), metavar=("REAL", "IMAG"),
+                        help="Julia constant")
+    parser.add_argument("--iterations", type=int, default=1024)
+    parser.add_argument("--kernel", choices=("optimized", "mariani_silver"), default="optimized")
+    parser.add_argument("--colouring", choices=("iteration", "histogram"), default="iteration")
+    parser.add_argument("--palette", help="palette file with one 'r g b' line per colour")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--tile", type=int, default=512)
+    args = parser.parse_args()
+
+    width, height = args.size
+    view = {
+        "width": width,
+        "height": height,
+        "center": args.center,
+        "scale": args.scale or 3 / min(width, height),
+        "mode": args.mode,
+        "c": args.c,
+        "iterations": args.iterations,
+        "kernel": args.kernel,
+    }
+    palette = load_palette(args.palette) if args.palette else create_palette(args.iterations)
+    render(view, args.output, palette, args.colouring, args.workers, args.tile)
+
+if __name__ == "__main__":
+    main()
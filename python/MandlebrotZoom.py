@@ -0,0 +1,135 @@
+import os
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import argparse
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, localcontext
+
+import numba
+import pygame
+
+from Mandlebrot import LastFrame, palette_lut, create_palette, load_palette
+from MandlebrotRender import make_fractals, ordered_results
+
+# Renders a zoom animation from (center, scale) keyframes. Each worker process
+# renders a run of consecutive frames, so within a run every frame can start
+# from the one before it: zooms resample it and only compute the pixels that
+# did not land in a flat region (Fractals.zoom_frame), pans at a fixed scale
+# shift it (Fractals.pan_frame). The first frame of every run is computed in
+# full, which also stops resampling errors building up over a long zoom.
+
+worker = None
+
+def start_worker(view):
+    global worker
+    numba.set_num_threads(1)
+    worker = make_fractals(view)
+
+# Frames are spread evenly over the keyframe segments. Within a segment the
+# scale moves geometrically, and the center moves in step with the scale so
+# the zoom heads straight for the next keyframe's center.
+def interpolate(keyframes, frames):
+    segments = len(keyframes) - 1
+    views = []
+    for i in range(frames):
+        t = i * segments / max(frames - 1, 1)
+        segment = min(int(t), segments - 1)
+        t -= segment
+        (real0, imag0, scale0), (real1, imag1, scale1) = keyframes[segment], keyframes[segment + 1]
+        scale = scale0 * (scale1 / scale0) ** t
+        weight = (scale0 - scale) / (scale0 - scale1) if scale0 != scale1 else t
+        with localcontext() as ctx:
+            ctx.prec = max(30, 20 - int(math.log10(min(scale0, scale1))))
+            weight = Decimal(weight)
+            views.append((real0 + (real1 - real0) * weight, imag0 + (imag1 - imag0) * weight, scale))
+    return views
+
+def render_frames(views, first, lut, output, reuse):
+    worker.last_frame = LastFrame()
+    rgb = []
+    for i, (real, imag, scale) in enumerate(views):
+        worker.scale = scale
+        worker.set_center_decimal(real, imag)
+        worker.UpdateCorners()
+        pixel_data = worker.zoom_frame() if reuse and i > 0 else None
+        if pixel_data is None:
+            pixel_data = worker.render_pixels()
+        else:
+            worker.store_frame(pixel_data)
+        frame = lut[pixel_data]
+        if output is None:
+            rgb.append(frame.transpose(1, 0, 2).tobytes())
+        else:
+            pygame.image.save(pygame.surfarray.make_surface(frame), output % (first + i))
+    return rgb
+
+def read_keyframes(filename):
+    keyframes = []
+    with open(filename, 'r') as file:
+        for line in file:
+            if line.strip() and not line.startswith("#"):
+                real, imag, scale = line.split()
+                keyframes.append((Decimal(real), Decimal(imag), float(scale)))
+    return keyframes
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a zoom animation between keyframes.")
+    parser.add_argument("keyframes", help="file with one 'real imag scale' keyframe per line")
+    parser.add_argument("output", help="numbered image pattern such as frames/zoom_%%05d.png, "
+                                       "or - to write raw RGB24 frames to stdout")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", default="1280x720", help="WIDTHxHEIGHT")
+    parser.add_argument("--mode", choices=("mandelbrot", "julia"), default="mandelbrot")
+    parser.add_argument("--c", nargs=2, type=float, default=(0.285, 0.01), metavar=("REAL", "IMAG"))
+    parser.add_argument("--iterations", type=int, default=1024)
+    parser.add_argument("--kernel", choices=("optimized", "mariani_silver"), default="optimized")
+    parser.add_argument("--palette", help="palette file with one 'r g b' line per colour")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--run", type=int, default=16, help="frames per worker run; the first is computed in full")
+    parser.add_argument("--no-reuse", dest="reuse", action="store_false",
+                        help="compute every frame in full")
+    args = parser.parse_args()
+
+    keyframes = read_keyframes(args.keyframes)
+    if len(keyframes) < 2:
+        parser.error("need at least two keyframes")
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    view = {
+        "width": width,
+        "height": height,
+        "center": keyframes[0][:2],
+        "scale": keyframes[0][2],
+        "mode": args.mode,
+        "c": args.c,
+        "iterations": args.iterations,
+        "kernel": args.kernel,
+    }
+    palette = load_palette(args.palette) if args.palette else create_palette(args.iterations)
+    # Scaled to maxIterations rather than each frame's maximum so the colours hold still
+    lut = palette_lut(args.iterations, palette)
+    output = None if args.output == "-" else args.output
+    if output is not None and os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+
+    views = interpolate(keyframes, args.frames)
+    jobs = [(views[first:first + args.run], first, lut, output, args.reuse)
+            for first in range(0, len(views), args.run)]
+    start = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(args.workers, initializer=start_worker, initargs=(view,)) as executor:
+        for (run, first, *_), rgb in zip(jobs, ordered_results(executor, render_frames, jobs, args.workers + 1)):
+            for frame in rgb:
+                sys.stdout.buffer.write(frame)
+            done += len(run)
+            elapsed = time.perf_counter() - start
+            print(f"{done}/{len(views)} frames   {done * 60 / elapsed:7.1f} frames/min", file=sys.stderr)
+    sys.stdout.flush()
+    elapsed = time.perf_counter() - start
+    print(f"rendered {len(views)} frames in {elapsed:.1f} s, {len(views) * 60 / elapsed:.1f} frames/min",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import pygame
 import numpy as np
 from numba import jit
 import os
+import threading
+import time
 from datetime import datetime
 
 # Constants
@@ -13,7 +15,7 @@ NUM_PARTICLES = 2000
 K = 0.05
 FRICTION = 0.85
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def update_particles(positions, velocities, types, forces, min_distances, radii):
     num_particles = len(positions)
     new_positions = np.empty_like(positions)
@@ -73,6 +75,13 @@ def set_parameters():
     radii = np.random.uniform(70, 250, (NUM_TYPES, NUM_TYPES))
     return forces, min_distances, radii
 
+# Compiles update_particles, or loads it from numba's cache, on a background
+# thread while the window opens
+def warm_up():
+    positions = np.random.rand(2, 2) * [WIDTH, HEIGHT]
+    types = np.random.randint(0, NUM_TYPES, 2)
+    update_particles(positions, np.zeros((2, 2)), types, *set_parameters())
+
 def save_screen(screen):
     if not os.path.exists("screenshots"):
         os.makedirs("screenshots")
@@ -83,6 +92,10 @@ def save_screen(screen):
     pygame.image.save(screen, filename)
 
 def main():
+    started = time.perf_counter()
+    warming = threading.Thread(target=warm_up, daemon=True)
+    warming.start()
+
     # Initialize Pygame
     pygame.init()
 
@@ -99,6 +112,7 @@ def main():
 
     # Main game loop
     running = True
+    first_frame = True
 
     while running:
         for event in pygame.event.get():
@@ -120,6 +134,9 @@ def main():
             pygame.draw.circle(screen, color, (int(positions[i, 0]), int(positions[i, 1])), 2)
 
         pygame.display.flip()
+        if first_frame:
+            print(f"First frame after {time.perf_counter() - started:.2f} s")
+            first_frame = False
 
         clock.tick(60)  # Limit to 60 FPS
 